@@ -1,18 +1,87 @@
 import SGTAMProdTaskConfig as config
 
-import sqlalchemy as sql
 import logging
+import queue
 import sys
+import threading
+import time
+import json
+import os
+from datetime import date, timedelta
 
 class SGTAMProd:
 
+	def __init__(self, **kwargs):
+		"""To initialise SGTAMProd, one pooled engine is kept per database and reused by every query
+
+		Parameter:
+		kwargs : dict
+			optional overrides of config.pool, keys of pool_size, max_overflow, pool_pre_ping and pool_recycle
+			example :
+				{'pool_size' : 2, 'pool_recycle' : 1800}
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		with SGTAMProd(pool_size=2) as s:
+			df = s.execute_query_to_df(sql_query='SELECT TOP 10 * FROM tLog', database='SGTAMProd')
+		"""
+
+		self.pool = dict(config.pool, **kwargs)
+		self.engines = {}
+		self.engines_lock = threading.Lock()
+		self.holidays = None
+		self.smtp = None
+		self.smtp_lock = threading.Lock()
+		self.notifications = None
+		self.notifier = None
+		self.pending_emails = []
+		self.notification_errors = []
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+	def close(self):
+		"""To send the queued notifications, then close the SMTP connection and dispose every pooled engine"""
+
+		self.flush()
+		if self.notifier is not None:
+			self.notifications.put(None)
+			self.notifier.join()
+			self.notifier = None
+
+		with self.smtp_lock:
+			if self.smtp is not None:
+				try:
+					self.smtp.quit()
+				except Exception:
+					pass
+				self.smtp = None
+
+		with self.engines_lock:
+			for database, engine in self.engines.items():
+				engine.dispose()
+				logging.info(f'Disposed SGTAMProd engine of {database}')
+			self.engines = {}
+
+
 	def __init_db_connection(self, database):
-		"""To initialise database connection"""
+		"""To get the pooled engine of database, it is created on first use"""
+
+		import sqlalchemy as sql
 
-		server = 'xxx'
-		username = config.db_username
-		password = config.db_password
-		self.engine = sql.create_engine(f"mssql+pymssql://{username}:{password}@{server}/{database}")
+		with self.engines_lock:
+			if database not in self.engines:
+				server = 'xxx'
+				username = config.db_username
+				password = config.db_password
+				self.engines[database] = sql.create_engine(f"mssql+pymssql://{username}:{password}@{server}/{database}", **self.pool)
+			return self.engines[database]
 
 
 	def execute_query_to_df(self, sql_query, database):
@@ -33,9 +102,9 @@ class SGTAMProd:
 		"""
 
 		import pandas as pd
-		self.__init_db_connection(database=database)
+		engine = self.__init_db_connection(database=database)
 		try:
-			with self.engine.connect() as con:
+			with engine.connect() as con:
 				df = pd.read_sql(sql=sql_query, con=con)
 				return df
 		except Exception as e:
@@ -43,6 +112,75 @@ class SGTAMProd:
 			sys.exit(f'Error executing query: {e}, {sql_query}')
 
 
+	def execute_query_to_df_chunks(self, sql_query, database, chunksize=None, dtype=None, as_rows=False):
+		"""To execute query and yield the result in chunks as the rows arrive
+
+		The rows are read with fetchmany on the DB-API cursor of a pooled connection. The mssql dialects of
+		SQLAlchemy have no server-side cursors and would ignore stream_results, but pymssql reads the rows of
+		each fetchmany off the wire only when they are asked for, so at most one chunk is held in memory and
+		the first chunk can be processed before the query has finished. Unlike execute_query_to_df an error is
+		logged and raised instead of exiting, as the caller may be half way through the result.
+
+		Parameter:
+		sql_query : str
+			SQL query to be executed.
+			example :
+				SELECT * FROM tLog
+		database : str
+			database to run the query on
+		chunksize : int
+			rows per chunk, default value is config.read_chunksize
+		dtype : dict
+			optional column to dtype hints applied to every chunk, keeps repeated strings and small
+			integers compact
+			example :
+				{'logTaskID' : 'int32', 'statusFlag' : 'int8', 'logMsg' : 'category'}
+		as_rows : bool
+			default value is False, True yields lists of row tuples without building DataFrames
+
+		Return:
+		generator
+			pandas.DataFrame per chunk, or list of rows per chunk with as_rows
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		s = SGTAMProd()
+		sql_query = 'SELECT logID, logTaskID, statusFlag, logDtTime FROM tLog'
+		for df in s.execute_query_to_df_chunks(sql_query=sql_query, database='SGTAMProd', chunksize=100000, dtype={'statusFlag' : 'int8'}):
+			print(len(df))
+		"""
+
+		if not as_rows:
+			import pandas as pd
+		chunksize = chunksize or config.read_chunksize
+		engine = self.__init_db_connection(database=database)
+		con = engine.raw_connection()
+		try:
+			cursor = con.cursor()
+			cursor.execute(sql_query)
+			columns = [column[0] for column in cursor.description]
+			while True:
+				rows = cursor.fetchmany(chunksize)
+				if not rows:
+					return
+				if as_rows:
+					yield rows
+					continue
+
+				df = pd.DataFrame.from_records(rows, columns=columns)
+				if dtype:
+					df = df.astype(dtype)
+				yield df
+		except GeneratorExit:
+			raise
+		except Exception as e:
+			logging.exception(f'Error executing query: {e}, {sql_query}')
+			raise
+		finally:
+			# back to the pool, unread rows are discarded
+			con.close()
+
+
 	def execute_query_with_result(self, sql_query, database):
 		"""To execute query and output to list
 
@@ -64,9 +202,9 @@ class SGTAMProd:
 		print(result[0][0])
 		"""
 
-		self.__init_db_connection(database=database)
+		engine = self.__init_db_connection(database=database)
 		try:
-			with self.engine.begin() as con:
+			with engine.begin() as con:
 				rs = con.execute(sql_query)
 				return rs.fetchall()
 		except Exception as e:
@@ -91,9 +229,9 @@ class SGTAMProd:
 		s.execute_query_without_result(sql_query=sql_query)
 		"""
 
-		self.__init_db_connection(database=database)
+		engine = self.__init_db_connection(database=database)
 		try:
-			with self.engine.begin() as con:
+			with engine.begin() as con:
 				con.execute(sql_query)				
 		except Exception as e:
 			logging.exception(f'Error executing query: {e}, {sql_query}')
@@ -217,6 +355,102 @@ class SGTAMProd:
 		self.execute_query_without_result(sql_query=sql_query, database='SGTAMProd')
 
 
+	def queue_tlog_update(self, **kwargs):
+		"""To update tLog on the background notification worker, the caller carries on without waiting for the database
+
+		The parameters are validated straight away and copied, so kwargs can be changed afterwards. Updates
+		run in the order they were queued, close waits for them.
+
+		Parameter:
+		kwargs : dict
+			same as update_tlog
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		with SGTAMProd() as s:
+			SGTAM_log_config['statusFlag'], SGTAM_log_config['logID']  = s.insert_tlog(**SGTAM_log_config)
+			SGTAM_log_config['logMsg'] = 'task has completed'
+			s.queue_tlog_update(**SGTAM_log_config)
+		"""
+
+		self.__validate_tlog_kwargs(**kwargs)
+		self.__validate_update_tlog_kwargs(**kwargs)
+		self.__notifier_queue().put(('tLog update', self.update_tlog, dict(kwargs)))
+
+
+	def queue_email(self, **kwargs):
+		"""To send an email at flush or close, after the last log line of the run
+
+		The email is held, not sent, so an attachment such as the log file of the run is read only once it is
+		complete. At flush the held emails are sent by the background notification worker over one SMTP
+		connection.
+
+		Parameter:
+		kwargs : dict
+			same as send_email
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		with SGTAMProd() as s:
+			s.queue_email(**email)
+			logging.info('this line is in the attached log file')
+		"""
+
+		self.__validate_email_kwargs(**kwargs)
+		self.pending_emails.append(dict(kwargs))
+
+
+	def flush(self):
+		"""To send the held emails and wait until every queued notification is done
+
+		A notification that fails is logged and kept in notification_errors, it does not stop the others.
+
+		Return:
+		list
+			errors of the notifications that failed so far
+		"""
+
+		if self.pending_emails:
+			notifications = self.__notifier_queue()
+			for kwargs in self.pending_emails:
+				notifications.put(('email', self.send_email, kwargs))
+			self.pending_emails = []
+
+		if self.notifier is not None:
+			self.notifications.join()
+		return self.notification_errors
+
+
+	def __notifier_queue(self):
+		"""To get the queue of the background notification worker, the worker is started on first use"""
+
+		if self.notifier is None:
+			self.notifications = queue.Queue()
+			self.notifier = threading.Thread(target=self.__notify, name='SGTAMProdNotifier', daemon=True)
+			self.notifier.start()
+		return self.notifications
+
+
+	def __notify(self):
+		"""To run the queued notifications one at a time until close puts None"""
+
+		while True:
+			notification = self.notifications.get()
+			try:
+				if notification is None:
+					return
+				name, function, kwargs = notification
+				start = time.perf_counter()
+				function(**kwargs)
+				logging.info(f'Queued {name} done in {time.perf_counter() - start:.2f}s.')
+			# update_tlog exits through sys.exit on a database error, it must not end the worker
+			except BaseException as e:
+				logging.error(f'Queued {name} failed: {e}')
+				self.notification_errors.append(f'{name}: {e}')
+			finally:
+				self.notifications.task_done()
+
+
 	def is_holiday(self, ref_date, include_weekend):
 		"""To check if ref_date is holiday
 
@@ -255,21 +489,147 @@ class SGTAMProd:
 			print('execute task')
 		"""
 
+		if self.get_holidays([ref_date], include_weekend)[self.__iso_date(ref_date)]:
+			logging.info(f'{ref_date} is holiday. Include weekend: {include_weekend}')
+			return True
+		else:
+			logging.info(f'{ref_date} is not holiday. Include weekend: {include_weekend}')
+			return False
+
+
+	def __validate_include_weekend(self, include_weekend):
+		"""To validate include_weekend parameter is 1 or 0"""
+
 		valid_include_weekend_code = [1, 0]
 		if include_weekend not in valid_include_weekend_code:
 			logging.exception(f"Invalid include_weekend parameter: {include_weekend}, expecting values: {valid_include_weekend_code}")
 			sys.exit(f"Invalid include_weekend parameter: {include_weekend}, expecting values: {valid_include_weekend_code}")
-		
-		sql_query = f"SELECT dbo.fnGetSkipExecutionResultBasedOnHoliday('{ref_date}', {include_weekend}) AS SkipExecution"
 
-		result = self.execute_query_with_result(sql_query=sql_query, database='EvoProd')
 
-		if result[0][0] == 1:
-			logging.info(f'{ref_date} is holiday. Include weekend: {include_weekend}')
-			return True
-		elif result[0][0] == 0:
-			logging.info(f'{ref_date} is not holiday. Include weekend: {include_weekend}')
-			return False
+	def __iso_date(self, ref_date):
+		return date.fromisoformat(str(ref_date)[:10]).isoformat()
+
+
+	def __load_holidays(self):
+		"""To load the holiday cache, from config.holiday_cache['filename'] without the entries older than its ttl"""
+
+		if self.holidays is not None:
+			return
+
+		self.holidays = self.__read_holidays()
+		if len(self.holidays) > 0:
+			logging.info(f"Loaded {len(self.holidays)} holiday results from {config.holiday_cache['filename']}")
+
+
+	def __read_holidays(self):
+		"""To read the entries of config.holiday_cache['filename'] younger than its ttl, each entry keeps its own fetch time"""
+
+		filename = config.holiday_cache['filename']
+		if not filename or not os.path.exists(filename):
+			return {}
+
+		with open(filename, 'r') as f:
+			cache = json.load(f)
+		if 'fetched_at' in cache:
+			# one fetch time for the whole file in earlier versions, it stands for every entry
+			cache['holidays'] = {key : {'holiday' : holiday, 'fetched_at' : cache['fetched_at']} for key, holiday in cache['holidays'].items()}
+		return {key : entry for key, entry in cache['holidays'].items() if not self.__holiday_expired(entry)}
+
+
+	def __holiday_expired(self, entry):
+		return time.time() - entry['fetched_at'] >= config.holiday_cache['ttl']
+
+
+	def __save_holidays(self):
+		"""To write the holiday cache, merged with the entries another run saved meanwhile, the later fetch of a date wins"""
+
+		filename = config.holiday_cache['filename']
+		if filename:
+			holidays = self.__read_holidays()
+			for key, entry in self.holidays.items():
+				if key not in holidays or holidays[key]['fetched_at'] < entry['fetched_at']:
+					holidays[key] = entry
+			os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+			with open(f'{filename}.{os.getpid()}.tmp', 'w') as f:
+				json.dump({'holidays' : holidays}, f)
+			os.replace(f'{filename}.{os.getpid()}.tmp', filename)
+
+
+	def get_holidays(self, ref_dates, include_weekend):
+		"""To check a list of dates for holiday, dates not cached yet are resolved with one query
+
+		Parameter:
+		ref_dates : list
+			reference dates you wish to check if is holiday
+			example :
+				['2022-04-28', '2022-04-29']
+
+		include_weekend : int
+			only 1 and 0 are accepted, see is_holiday
+
+		Return:
+		dict
+			date in 'YYYY-MM-DD' to True (Is Holiday, skip execution) or False (Is Not Holiday)
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		s = SGTAMProd()
+		holidays = s.get_holidays(['2022-04-28', '2022-04-30', '2022-05-01'], include_weekend=1)
+		print(holidays['2022-05-01'])
+		"""
+
+		self.__validate_include_weekend(include_weekend)
+		self.__load_holidays()
+
+		ref_dates = [self.__iso_date(ref_date) for ref_date in ref_dates]
+		# every entry expires ttl after it was fetched, whenever the dates around it were
+		missing = sorted(set(ref_date for ref_date in ref_dates
+							 if f'{ref_date}|{include_weekend}' not in self.holidays or self.__holiday_expired(self.holidays[f'{ref_date}|{include_weekend}'])))
+
+		if len(missing) > 0:
+			logging.info(f'Get holiday results of {len(missing)} dates from {missing[0]} to {missing[-1]}. Include weekend: {include_weekend}')
+			values = ', '.join(f"('{ref_date}')" for ref_date in missing)
+			sql_query = f"""SELECT d.refDate, dbo.fnGetSkipExecutionResultBasedOnHoliday(d.refDate, {include_weekend}) AS SkipExecution
+				FROM (VALUES {values}) AS d(refDate)"""
+			result = self.execute_query_with_result(sql_query=sql_query, database='EvoProd')
+
+			fetched_at = time.time()
+			for row in result:
+				self.holidays[f'{self.__iso_date(row[0])}|{include_weekend}'] = {'holiday' : row[1] == 1, 'fetched_at' : fetched_at}
+			self.__save_holidays()
+
+		return {ref_date : self.holidays[f'{ref_date}|{include_weekend}']['holiday'] for ref_date in ref_dates}
+
+
+	def prefetch_holidays(self, date_from, date_to, include_weekend):
+		"""To resolve every date between date_from and date_to (inclusive) with one query into the holiday cache
+
+		Later is_holiday and get_holidays calls for these dates are answered in memory, or from
+		config.holiday_cache['filename'] in later runs within its ttl.
+
+		Parameter:
+		date_from : str
+			first date of the range
+			example :
+				'2022-04-01'
+		date_to : str
+			last date of the range
+			example :
+				'2022-06-30'
+		include_weekend : int
+			only 1 and 0 are accepted, see is_holiday
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		s = SGTAMProd()
+		s.prefetch_holidays('2022-04-01', '2022-06-30', include_weekend=1)
+		if s.is_holiday(ref_date='2022-04-28', include_weekend=1):
+			print('execute task')
+		"""
+
+		first = date.fromisoformat(self.__iso_date(date_from))
+		last = date.fromisoformat(self.__iso_date(date_to))
+		self.get_holidays([first + timedelta(days=d) for d in range((last - first).days + 1)], include_weekend)
 
 
 	def __validate_pre_requisite_log_kwargs(self, **kwargs):
@@ -303,7 +663,81 @@ class SGTAMProd:
 				sys.exit(f'Invalid allowedStatus: {invalid_allowed_status_code} in {k}! Expected status: {ref_allowed_status_code}')
 
 
-	def is_SGTAMProd_log_task_passed(self, ref_date, **kwargs):
+	def get_latest_log_status(self, ref_date, log_task_ids):
+		"""To get the latest logStatus of several logTaskIDs on ref_date in one round trip
+
+		SP_GetLatestLogStatusByLogTaskID runs once per logTaskID, all calls in one batch sent in a single
+		round trip, so the result is exactly that of the unbatched check. The logStatus is read from the
+		third column of each result set, as is_SGTAMProd_log_task_passed does.
+
+		Parameter:
+		ref_date : str
+			reference date
+			example :
+				'2022-04-28'
+		log_task_ids : list
+			logTaskIDs to resolve
+			example :
+				[88, 89]
+
+		Return:
+		dict
+			logTaskID to logStatus, -1 when the logTaskID has no tLog entry on ref_date
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		s = SGTAMProd()
+		print(s.get_latest_log_status('2022-04-29', [88, 89]))
+		"""
+
+		log_task_ids = sorted(set(int(log_task_id) for log_task_id in log_task_ids))
+		if len(log_task_ids) == 0:
+			return {}
+
+		sql_query = '\n'.join(f"EXEC SP_GetLatestLogStatusByLogTaskID {log_task_id}, '{ref_date}'" for log_task_id in log_task_ids)
+		engine = self.__init_db_connection(database='SGTAMProd')
+		conn = engine.raw_connection()
+		try:
+			cursor = conn.cursor()
+			cursor.execute(sql_query)
+			# one result set per EXEC, row counts of the procedures carry no columns and are skipped
+			results = []
+			while True:
+				if cursor.description is not None:
+					results.append(cursor.fetchall())
+				if not cursor.nextset():
+					break
+			conn.commit()
+			if len(results) != len(log_task_ids):
+				raise Exception(f'{len(results)} result sets for {len(log_task_ids)} logTaskIDs')
+		except Exception as e:
+			logging.exception(f'Error executing query: {e}, {sql_query}')
+			sys.exit(f'Error executing query: {e}, {sql_query}')
+		finally:
+			conn.close()
+
+		return {log_task_id : -1 if len(result) == 0 else int(result[0][2]) for log_task_id, result in zip(log_task_ids, results)}
+
+
+	def __check_log_status(self, log_status, **kwargs):
+		"""To compare resolved logStatus against allowedStatus of every pre-requisite task
+
+		Return:
+		list
+			names of pre-requisite tasks not passed yet
+		"""
+
+		pending = []
+		for k, v in kwargs.items():
+			if log_status[v['logTaskID']] in v['allowedStatus']:
+				logging.info(f"LogTask '{k}' : {v['logTaskID']} logStatus {log_status[v['logTaskID']]} matched with allowed status: {v['allowedStatus']}!")
+			else:
+				logging.warning(f"LogTask '{k}' : {v['logTaskID']} logStatus {log_status[v['logTaskID']]} does not match with allowed status: {v['allowedStatus']}!")
+				pending.append(k)
+		return pending
+
+
+	def is_SGTAMProd_log_task_passed(self, ref_date, batch=False, **kwargs):
 		"""To check if pre-requisite SGTAMProd log task passed
 
 		Parameter:
@@ -312,6 +746,10 @@ class SGTAMProd:
 			example : 
 				'2022-04-28'
 
+		batch : bool
+			default value is False, one SP_GetLatestLogStatusByLogTaskID call per task
+			True runs the same procedure for all tasks in one round trip, see get_latest_log_status
+
 		kwargs : dict
 			expecting dictionary including keys of pre-requisite task name, a sub-dictionary of logTaskID and allowedStatus			
 			logTaskID : int
@@ -339,23 +777,26 @@ class SGTAMProd:
 
 		if s.is_SGTAMProd_log_task_passed('2022-04-29', **pre_requisite_log):
     		print('execute task')
+
+		if s.is_SGTAMProd_log_task_passed('2022-04-29', batch=True, **pre_requisite_log):
+    		print('execute task')
 		"""
 
 		self.__validate_pre_requisite_log_kwargs(**kwargs)		
-		is_passed = True
 
-		for k, v in kwargs.items():
-			logging.info(f"Get logTaskStatus {k}: {v['logTaskID']} on {ref_date}")
-			sql_query = f"EXEC SP_GetLatestLogStatusByLogTaskID {v['logTaskID']}, '{ref_date}'"
-			result = self.execute_query_with_result(sql_query=sql_query, database='SGTAMProd')
+		if batch:
+			logging.info(f"Get logTaskStatus {[v['logTaskID'] for v in kwargs.values()]} on {ref_date}")
+			log_status = self.get_latest_log_status(ref_date, [v['logTaskID'] for v in kwargs.values()])
+		else:
+			log_status = {}
+			for k, v in kwargs.items():
+				logging.info(f"Get logTaskStatus {k}: {v['logTaskID']} on {ref_date}")
+				sql_query = f"EXEC SP_GetLatestLogStatusByLogTaskID {v['logTaskID']}, '{ref_date}'"
+				result = self.execute_query_with_result(sql_query=sql_query, database='SGTAMProd')
 
-			log_status = -1 if len(result) == 0 else int(result[0][2])
+				log_status[v['logTaskID']] = -1 if len(result) == 0 else int(result[0][2])
 
-			if log_status in v['allowedStatus']:
-				logging.info(f"LogTask '{k}' : {v['logTaskID']} logStatus {log_status} matched with allowed status: {v['allowedStatus']}!")				
-			else:
-				logging.warning(f"LogTask '{k}' : {v['logTaskID']} logStatus {log_status} does not match with allowed status: {v['allowedStatus']}!")
-				is_passed = False
+		is_passed = len(self.__check_log_status(log_status, **kwargs)) == 0
 		
 		if is_passed:
 			logging.info("SGTAMProd Log passed!")
@@ -365,6 +806,63 @@ class SGTAMProd:
 			return False
 
 
+	def wait_SGTAMProd_log_task_passed(self, ref_date, timeout=3600, interval=30, max_interval=600, **kwargs):
+		"""To wait until pre-requisite SGTAMProd log tasks passed, polling with backoff
+
+		Every poll resolves only the tasks still pending in one round trip, see get_latest_log_status. The wait between polls
+		starts at interval and doubles up to max_interval.
+
+		Parameter:
+		ref_date : str
+			reference date, see is_SGTAMProd_log_task_passed
+		timeout : int
+			seconds to wait in total before giving up, default value is 3600
+		interval : int
+			seconds before the second poll, default value is 30
+		max_interval : int
+			upper bound of seconds between polls, default value is 600
+		kwargs : dict
+			pre-requisite tasks, see is_SGTAMProd_log_task_passed
+
+		Return:
+		boolean
+			True (Passed) as soon as every task passed, False (Not Passed) when timeout is reached.
+
+		Example:
+		from SGTAMProdTask import SGTAMProd
+		s = SGTAMProd()
+		pre_requisite_log = {
+			'Prelim PLD V3 SFTP Upload' : {'logTaskID' : 88, 'allowedStatus' : [1,3]},
+			'Check Prelim PLD V3 SFTP' : {'logTaskID' : 89, 'allowedStatus' : [1]},
+		}
+
+		if s.wait_SGTAMProd_log_task_passed('2022-04-29', timeout=7200, **pre_requisite_log):
+    		print('execute task')
+		"""
+
+		self.__validate_pre_requisite_log_kwargs(**kwargs)
+		deadline = time.monotonic() + timeout
+		pending = dict(kwargs)
+
+		while True:
+			logging.info(f"Get logTaskStatus {[v['logTaskID'] for v in pending.values()]} on {ref_date}")
+			log_status = self.get_latest_log_status(ref_date, [v['logTaskID'] for v in pending.values()])
+			pending = {k : pending[k] for k in self.__check_log_status(log_status, **pending)}
+
+			if len(pending) == 0:
+				logging.info("SGTAMProd Log passed!")
+				return True
+
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				logging.info(f"SGTAMProd Log not passed after {timeout}s, still pending: {list(pending)}")
+				return False
+
+			logging.info(f"Waiting {min(interval, remaining):.0f}s for pending LogTask {list(pending)}")
+			time.sleep(min(interval, remaining))
+			interval = min(interval * 2, max_interval)
+
+
 	def __validate_email_kwargs(self, **kwargs):
 		"""To validate email parameters to ensure required keys are there
 		
@@ -443,13 +941,9 @@ class SGTAMProd:
 		s.send_email(**email)
 		"""
 
-		import smtplib
-		from email import encoders
 		from email.mime.multipart import MIMEMultipart
-		from email.mime.base import MIMEBase
 		from email.mime.text import MIMEText
-		import os
-		
+
 		self.__validate_email_kwargs(**kwargs)
 
 		email = MIMEMultipart('alternative')
@@ -468,16 +962,64 @@ class SGTAMProd:
 		email.attach(email_text)
 		if 'filename' in kwargs:
 			if len(kwargs['filename']) > 0:
-				with open(kwargs['filename'], "rb") as attachment:
-					attch = MIMEBase("application", "octet-stream")
-					attch.set_payload(attachment.read())
-				encoders.encode_base64(attch)
-
-				attch.add_header(
-					"Content-Disposition",
-					"attachment", filename=os.path.basename(kwargs['filename'])
-				)
-				email.attach(attch)
-
-		with smtplib.SMTP('mailout.gfk.com', 25) as s:
-			s.send_message(email)
+				email.attach(self.__attachment(kwargs['filename']))
+
+		with self.smtp_lock:
+			self.__smtp_connection().send_message(email)
+		logging.info(f"Email sent: {kwargs['subject']}")
+
+
+	def __attachment(self, filename):
+		"""To build the MIME part of an attachment
+
+		Files of at least config.attachment_gzip_bytes are streamed through gzip in 1 MB blocks and attached
+		as {filename}.gz, only the compressed bytes are held in memory.
+		"""
+
+		from email import encoders
+		from email.mime.base import MIMEBase
+
+		name = os.path.basename(filename)
+		if config.attachment_gzip_bytes is not None and os.path.getsize(filename) >= config.attachment_gzip_bytes:
+			import gzip
+			import io
+			import shutil
+
+			buffer = io.BytesIO()
+			with open(filename, "rb") as attachment, gzip.GzipFile(filename=name, mode='wb', fileobj=buffer) as compressed:
+				shutil.copyfileobj(attachment, compressed, 2**20)
+			attch = MIMEBase("application", "gzip")
+			attch.set_payload(buffer.getvalue())
+			name = f'{name}.gz'
+		else:
+			with open(filename, "rb") as attachment:
+				attch = MIMEBase("application", "octet-stream")
+				attch.set_payload(attachment.read())
+		encoders.encode_base64(attch)
+
+		attch.add_header(
+			"Content-Disposition",
+			"attachment", filename=name
+		)
+		return attch
+
+
+	def __smtp_connection(self):
+		"""To get the SMTP connection shared by every email, opened on first use and again when the server has dropped it"""
+
+		import smtplib
+
+		if self.smtp is not None:
+			try:
+				if self.smtp.noop()[0] != 250:
+					raise smtplib.SMTPServerDisconnected('NOOP refused')
+			except (smtplib.SMTPException, OSError):
+				try:
+					self.smtp.close()
+				except Exception:
+					pass
+				self.smtp = None
+
+		if self.smtp is None:
+			self.smtp = smtplib.SMTP(config.smtp['host'], config.smtp['port'], timeout=config.smtp['timeout'])
+		return self.smtp
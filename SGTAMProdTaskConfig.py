@@ -1,2 +1,24 @@
 db_username = 'xxx'
 db_password = 'xxx'
+
+pool = {
+	'pool_size' : 5,
+	'max_overflow' : 10,
+	'pool_pre_ping' : True,
+	'pool_recycle' : 3600
+}
+
+read_chunksize = 50000 # rows per chunk of execute_query_to_df_chunks
+
+holiday_cache = {
+	'filename' : None, # e.g. 'holiday_cache.json' to reuse holiday results across runs
+	'ttl' : 86400 # seconds each holiday result is reused after it was fetched
+}
+
+smtp = {
+	'host' : 'mailout.gfk.com',
+	'port' : 25,
+	'timeout' : 60
+}
+
+attachment_gzip_bytes = 2**20 # attachments of at least this size are sent gzip compressed as .gz, None to never compress
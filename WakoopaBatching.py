@@ -0,0 +1,150 @@
+import logging
+import time
+from itertools import islice
+
+
+# Fragments of driver errors worth retrying: SQL Server deadlock victim (1205, SQLSTATE 40001) and ODBC timeouts (HYT00, HYT01)
+RETRYABLE_ERRORS = ['40001', '1205', 'HYT00', 'HYT01', 'deadlock', 'timeout']
+
+
+class WakoopaBatchSizer:
+
+    def __init__(self, size=10000, min_size=1000, max_size=100000, max_bytes=256 * 2**20, max_seconds=60.0, retries=3, backoff=5.0):
+        """To initialise an adaptive batch size for the database writes
+
+        The size climbs towards the highest rows/sec: it keeps moving in the same direction, by a factor of
+        1.5, as long as throughput does not drop by more than 5%, and turns around when it does. A batch
+        slower than max_seconds or larger than max_bytes shrinks the size, and so does a deadlock or a
+        timeout, after which the batch is retried as a whole.
+
+        Parameter:
+        size : int
+            starting batch size, usually the size remembered from the previous run
+        min_size : int
+            smallest batch size, default value is 1000
+        max_size : int
+            largest batch size, default value is 100000
+        max_bytes : int
+            upper bound of the in-memory size of one batch, which also bounds the parameter array sent to
+            the server, default value is 256 MB
+        max_seconds : float
+            latency above which a batch is considered too large, default value is 60 seconds
+        retries : int
+            attempts after a deadlock or a timeout before the error is raised, default value is 3
+        backoff : float
+            seconds waited before the first retry, doubled on each further retry, default value is 5
+
+        Example:
+        from WakoopaBatching import WakoopaBatchSizer
+        sizer = WakoopaBatchSizer(size=state.get('batch_size', 10000))
+        for rows in sizer.chunked(participants):
+            df = transform(rows)
+            sizer.write(lambda: loader.insert(df), rows=len(df), bytes=int(df.memory_usage(deep=True).sum()))
+        state.set('batch_size', sizer.best_size)
+        """
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.size = self.__clamp(size)
+        self.direction = 1
+        self.last_rate = None
+        # size of the fastest batch within the limits, the starting point worth remembering for the next run
+        self.best_size = self.size
+        self.best_rate = None
+
+
+    def __clamp(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+
+    def chunked(self, iterable):
+        """To split iterable into lists of the current batch size, read again before every batch"""
+
+        iterator = iter(iterable)
+        while True:
+            chunk = list(islice(iterator, self.size))
+            if not chunk:
+                return
+            yield chunk
+
+
+    def record(self, rows, seconds, bytes=0):
+        """To adjust the batch size from the measured latency, throughput and memory of one batch
+
+        Return:
+        int
+            batch size for the next batches
+        """
+
+        if rows == 0 or seconds <= 0:
+            return self.size
+
+        rate = rows / seconds
+        previous = self.size
+        if bytes and bytes > self.max_bytes:
+            self.size = self.__clamp(rows * self.max_bytes / bytes)
+            self.direction = -1
+            reason = f'{bytes / 2**20:.0f}MB over the {self.max_bytes / 2**20:.0f}MB limit'
+        elif seconds > self.max_seconds:
+            self.size = self.__clamp(rows * self.max_seconds / seconds)
+            self.direction = -1
+            reason = f'{seconds:.1f}s over the {self.max_seconds:.0f}s latency limit'
+        else:
+            if self.last_rate is not None and rate < self.last_rate * 0.95:
+                self.direction = -self.direction
+            self.size = self.__clamp(self.size * 1.5 if self.direction > 0 else self.size / 1.5)
+            # never grow past what max_bytes allows at the measured row width
+            if bytes:
+                self.size = min(self.size, self.__clamp(rows * self.max_bytes / bytes))
+            reason = f'{rate:.0f} rows/sec'
+            if self.best_rate is None or rate > self.best_rate:
+                self.best_size, self.best_rate = self.__clamp(rows), rate
+        self.last_rate = rate
+
+        if self.size != previous:
+            logging.info(f'Batch size {previous} -> {self.size} after {rows} rows in {seconds:.2f}s, {reason}.')
+        return self.size
+
+
+    def write(self, function, rows, bytes=0, record=True):
+        """To run one database write of a batch, retrying it on deadlocks and timeouts
+
+        The write must be atomic, as WakoopaLoader.insert and upsert are, so a failed attempt leaves nothing
+        behind and the batch can be sent again as a whole.
+
+        Parameter:
+        function : function
+            the write, called without arguments
+        rows : int
+            rows written by function
+        bytes : int
+            in-memory size of the batch, 0 when unknown
+        record : bool
+            default value is True, False only retries and leaves the batch size alone
+
+        Return:
+        value returned by function
+        """
+
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                result = function()
+            except Exception as e:
+                if attempt == self.retries or not any(fragment.lower() in str(e).lower() for fragment in RETRYABLE_ERRORS):
+                    raise
+                # a deadlock or timeout says the server is under pressure, later batches get smaller
+                self.size = self.__clamp(self.size / 2)
+                self.direction = -1
+                wait = self.backoff * 2**attempt
+                logging.warning(f'Batch of {rows} rows failed ({e}), retry {attempt + 1} of {self.retries} in {wait:.0f}s, batch size lowered to {self.size}.')
+                time.sleep(wait)
+                continue
+
+            if record:
+                self.record(rows, time.perf_counter() - start, bytes)
+            return result
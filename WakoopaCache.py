@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+
+# Query parameters that change on every request and must not be part of the cache key
+SIGNING_PARAMS = ['nonce', 'timestamp', 'signature']
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+class WakoopaCache:
+
+    def __init__(self, directory, ttl=86400, max_bytes=512 * 2**20):
+        """To initialise an on-disk cache of gzip compressed API responses
+
+        Parameter:
+        directory : str
+            folder of the cached responses, created on first write
+        ttl : int
+            seconds a cached response stays valid counted from when it was fetched, default value is 86400
+        max_bytes : int
+            upper bound of the compressed size of the cache, least recently used responses are evicted
+            first, default value is 512 MB
+
+        The modification time of a cached response is when it was fetched, its access time when it was
+        last read, set explicitly so it does not depend on the file system updating access times.
+
+        Example:
+        from WakoopaCache import WakoopaCache
+        from WakoopaTask import Wakoopa
+        w = Wakoopa(client='xxx', secret='xxx', cache=WakoopaCache('cache', ttl=3600), read_cache=True)
+        """
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+
+    def key(self, endpoint, params):
+        """To compute the cache key of a request from its endpoint and query parameters, without nonce, timestamp and signature"""
+
+        params = {k : str(v) for k, v in params.items() if k not in SIGNING_PARAMS}
+        return hashlib.sha256(json.dumps([endpoint, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+    def __filename(self, key):
+        return os.path.join(self.directory, f'{key}.json.gz')
+
+
+    def read(self, key, chunk_size=65536):
+        """To read a cached response
+
+        Return:
+        generator
+            decompressed bytes chunks of the response, or None when it is not cached or older than ttl
+        """
+
+        filename = self.__filename(key)
+        try:
+            fetched_at = os.path.getmtime(filename)
+        except FileNotFoundError:
+            return None
+
+        now = time.time()
+        age = now - fetched_at
+        if age >= self.ttl:
+            _remove(filename)
+            return None
+
+        # atime is the last access for eviction, mtime stays the fetch time the ttl counts from
+        os.utime(filename, (now, fetched_at))
+        logging.info(f'Cache hit {key[:12]}, {age:.0f}s old.')
+
+        def chunks():
+            with gzip.open(filename, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+
+    def write(self, key, chunks):
+        """To cache a response while it is being consumed
+
+        The chunks are passed through unchanged and compressed to a temporary file. Nothing is cached
+        until commit is called on the returned writer, once the response has been read to the end and
+        parsed, a response that broke off or does not parse is discarded.
+
+        Parameter:
+        key : str
+            cache key, see key
+        chunks : iterable
+            bytes chunks of the response
+
+        Return:
+        WakoopaCacheWriter
+            iterable of the same bytes chunks
+
+        Example:
+        writer = cache.write(key, response.iter_content(chunk_size=65536))
+        try:
+            result = json.loads(b''.join(writer))
+        except Exception:
+            writer.discard()
+            raise
+        writer.commit()
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        return WakoopaCacheWriter(self, self.__filename(key), chunks)
+
+
+    def evict(self):
+        """To remove expired responses, then least recently used ones until the cache fits in max_bytes"""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json.gz'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_mtime, stat.st_size, filename))
+
+        now = time.time()
+        total_bytes = 0
+        for atime, mtime, size, filename in sorted(entries, reverse=True):
+            if now - mtime >= self.ttl or total_bytes + size > self.max_bytes:
+                _remove(filename)
+                logging.info(f'Evicted {os.path.basename(filename)} from cache.')
+            else:
+                total_bytes += size
+
+
+class WakoopaCacheWriter:
+
+    def __init__(self, cache, filename, chunks):
+        """To write one response to a temporary file as it is consumed, see WakoopaCache.write"""
+
+        self.cache = cache
+        self.filename = filename
+        self.tmp_filename = f'{filename}.{os.getpid()}.{id(self)}.tmp'
+        self.complete = False
+        self.chunks = self.__write(chunks)
+
+
+    def __iter__(self):
+        return self.chunks
+
+
+    def __write(self, chunks):
+        with gzip.open(self.tmp_filename, 'wb', compresslevel=6) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        self.complete = True
+
+
+    def commit(self):
+        """To add the response to the cache, only once every chunk has been consumed"""
+
+        if not self.complete:
+            self.discard()
+            raise Exception(f'Response for {os.path.basename(self.filename)} was not read to the end, not cached')
+
+        os.replace(self.tmp_filename, self.filename)
+        self.cache.evict()
+
+
+    def discard(self):
+        """To drop the temporary file of a response that broke off or did not parse"""
+
+        # closing the generator closes the gzip file first, an open file cannot be removed on Windows
+        self.chunks.close()
+        _remove(self.tmp_filename)
@@ -0,0 +1,167 @@
+import logging
+import os
+import shutil
+
+from WakoopaTransform import row_hash
+
+
+class WakoopaHashIndex:
+
+    def __init__(self, filename):
+        """To initialise the local index of participant content hashes, used to write only what changed
+
+        The index maps id to the row_hash of the participant as last written to tWakoopaParticipants and
+        is kept as a gzip compressed pickle of a uint64 Series. The hashes and counts of a run only take
+        in the batches passed to commit, the ones written to the target table.
+
+        Parameter:
+        filename : str
+            path of the index file
+            example :
+                'state/tWakoopaParticipant_hashes.pkl.gz'
+
+        Example:
+        from WakoopaChanges import WakoopaHashIndex
+        index = WakoopaHashIndex('state/tWakoopaParticipant_hashes.pkl.gz')
+        for df in batches:
+            changed, batch = index.diff(df)
+            loader.upsert(changed)
+            index.commit(batch)
+        loader.delete(index.deleted_ids())
+        index.save()
+        """
+
+        import pandas as pd
+
+        self.filename = filename
+        # one file per committed batch, so a checkpoint only writes the hashes of its own batch
+        self.progress_dir = f'{filename}.partial'
+        self.hashes = pd.read_pickle(filename) if os.path.exists(filename) else None
+        self.seen = []
+        self.counts = {'new' : 0, 'updated' : 0, 'unchanged' : 0}
+
+
+    def exists(self):
+        return self.hashes is not None
+
+
+    def diff(self, df, devices=None):
+        """To compare a batch against the index, nothing is kept until the returned batch is passed to commit
+
+        Parameter:
+        df : pandas.DataFrame
+            batch as returned by transform
+        devices : pandas.DataFrame
+            devices of the batch as returned by transform_devices, when devices are imported, a participant
+            whose devices changed then counts as updated, see row_hash
+
+        Return:
+        pandas.DataFrame
+            rows of df that are new or whose content changed, all rows when there is no index yet
+        dict
+            hashes and counts of the batch, for commit
+        """
+
+        hashes = row_hash(df, devices)
+
+        if self.hashes is None:
+            return df, {'hashes' : hashes, 'counts' : {'new' : len(df), 'updated' : 0, 'unchanged' : 0}}
+
+        is_new = ~hashes.index.isin(self.hashes.index)
+        previous = self.hashes.reindex(hashes.index, fill_value=0)
+        is_changed = previous.values != hashes.values
+
+        counts = {'new' : int(is_new.sum()), 'updated' : int((is_changed & ~is_new).sum()), 'unchanged' : int((~is_changed).sum())}
+        return df[is_changed], {'hashes' : hashes, 'counts' : counts}
+
+
+    def commit(self, batch):
+        """To keep the hashes and counts of a batch returned by diff, once the batch has been written"""
+
+        self.seen.append(batch['hashes'])
+        for name, value in batch['counts'].items():
+            self.counts[name] += value
+
+
+    def deleted_ids(self):
+        """To get the ids in the index that were not seen by diff in this run, only meaningful after a full API pull"""
+
+        import pandas as pd
+
+        if self.hashes is None:
+            return []
+
+        seen = pd.concat(self.seen).index if self.seen else []
+        return self.hashes.index.difference(seen).tolist()
+
+
+    def save_progress(self, batch_number, batch):
+        """To write the hashes and counts of one committed batch to {filename}.partial/{batch_number}.pkl.gz, called at every import checkpoint"""
+
+        import pandas as pd
+
+        os.makedirs(self.progress_dir, exist_ok=True)
+        filename = os.path.join(self.progress_dir, f'{batch_number:08d}.pkl.gz')
+        tmp_filename = f'{filename}.tmp'
+        pd.to_pickle(batch, tmp_filename, compression='gzip')
+        os.replace(tmp_filename, filename)
+
+
+    def load_progress(self, last_batch):
+        """To carry on from the batches written by save_progress of an interrupted run
+
+        Parameter:
+        last_batch : int
+            last batch committed by the interrupted run, the progress of later batches is dropped, they were
+            written after the checkpoint and will be diffed again
+        """
+
+        import pandas as pd
+
+        if not os.path.isdir(self.progress_dir):
+            raise Exception(f'No participant hash progress found at {self.progress_dir}, cannot resume, exiting')
+
+        self.seen = []
+        self.counts = {'new' : 0, 'updated' : 0, 'unchanged' : 0}
+        for name in sorted(os.listdir(self.progress_dir)):
+            filename = os.path.join(self.progress_dir, name)
+            if not name.endswith('.pkl.gz'):
+                continue
+            if int(name.split('.')[0]) > last_batch:
+                os.remove(filename)
+                continue
+            self.commit(pd.read_pickle(filename, compression='gzip'))
+        logging.info(f"Loaded {sum(len(hashes) for hashes in self.seen)} participant hashes of the interrupted run.")
+
+
+    def clear_progress(self):
+        """To remove the progress of an earlier run, a new run starts without it"""
+
+        if os.path.isdir(self.progress_dir):
+            shutil.rmtree(self.progress_dir)
+        elif os.path.exists(self.progress_dir):
+            os.remove(self.progress_dir)
+
+
+    def save(self, replace=True):
+        """To write the hashes seen in this run as the new index
+
+        Parameter:
+        replace : bool
+            default value is True, the index becomes exactly the participants seen in this run (full API pull)
+            False merges them into the existing index (incremental pull)
+        """
+
+        import pandas as pd
+
+        hashes = pd.concat(self.seen) if self.seen else pd.Series([], dtype='uint64')
+        if not replace and self.hashes is not None:
+            hashes = pd.concat([self.hashes, hashes])
+        hashes = hashes[~hashes.index.duplicated(keep='last')]
+
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        tmp_filename = f'{self.filename}.tmp'
+        hashes.to_pickle(tmp_filename, compression='gzip')
+        os.replace(tmp_filename, self.filename)
+        self.clear_progress()
+        logging.info(f'Saved {len(hashes)} participant hashes to {self.filename}.')
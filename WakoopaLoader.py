@@ -0,0 +1,388 @@
+import logging
+import time
+
+
+COLUMNS = ['import_date', 'id', 'tags', 'time_zone', 'created_at', 'profile_url']
+
+# tWakoopaParticipantDevices, one row per device keyed on device_id
+DEVICE_COLUMNS = ['import_date', 'participant_id', 'device_id', 'platform', 'created_at']
+
+# In-memory schema of the frames built by WakoopaTransform, few distinct values become categories,
+# timestamps are parsed to naive UTC and tags are joined with TAG_DELIMITER into one string
+DTYPES = {
+    'import_date' : 'object',
+    'id' : 'int64',
+    'tags' : 'object',
+    'time_zone' : 'category',
+    'created_at' : 'datetime64[ns]',
+    'profile_url' : 'object',
+}
+
+DEVICE_DTYPES = {
+    'import_date' : 'object',
+    'participant_id' : 'int64',
+    'device_id' : 'int64',
+    'platform' : 'category',
+    'created_at' : 'datetime64[ns]',
+}
+
+TAG_DELIMITER = '|'
+
+# SQL Server columns of tWakoopaParticipantDevices, see WakoopaLoader.create_table
+DEVICE_SQL_TYPES = {
+    'import_date' : 'DATE',
+    'participant_id' : 'BIGINT NOT NULL',
+    'device_id' : 'BIGINT NOT NULL',
+    'platform' : 'NVARCHAR(100)',
+    'created_at' : 'DATETIME2',
+}
+
+
+class WakoopaLoader:
+
+    def __init__(self, engine, table_name, key='id', columns=COLUMNS, parent_key=None, sql_types=None):
+        """To initialise loader of participant data into SQL Server
+
+        Parameter:
+        engine : sqlalchemy.engine.Engine
+            engine connected to the target database
+        table_name : str
+            target table
+            example :
+                'tWakoopaParticipants'
+        key : str
+            column identifying a row, used for upsert and the clustered index
+        columns : list
+            columns written to the table, default value is COLUMNS
+            example :
+                DEVICE_COLUMNS
+        parent_key : str
+            optional column referencing the participant a row belongs to, indexed, and the column upsert
+            matches replace_ids against
+            example :
+                'participant_id'
+        sql_types : dict
+            optional SQL Server type per column, needed by create_table
+            example :
+                DEVICE_SQL_TYPES
+
+        Example:
+        from WakoopaLoader import WakoopaLoader, DEVICE_COLUMNS
+        loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipants')
+        loader.insert(df)
+        device_loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipantDevices', key='device_id', columns=DEVICE_COLUMNS,
+                                      parent_key='participant_id', sql_types=DEVICE_SQL_TYPES)
+        device_loader.create_table()
+        device_loader.upsert(devices, replace_ids=df['id'].tolist())
+        """
+
+        self.engine = engine
+        self.table_name = table_name
+        self.key = key
+        self.columns = columns
+        self.parent_key = parent_key
+        self.sql_types = sql_types
+        self.delta_table_name = f'{table_name}_delta'
+        self.staging_table_name = f'{table_name}_staging'
+        self.old_table_name = f'{table_name}_old'
+
+
+    def __create_indexes(self, conn, table_name):
+        conn.execute(f'CREATE CLUSTERED INDEX IX_{self.table_name}_{self.key} ON {table_name} ({self.key})')
+        if self.parent_key:
+            conn.execute(f'CREATE INDEX IX_{self.table_name}_{self.parent_key} ON {table_name} ({self.parent_key})')
+
+
+    def create_table(self):
+        """To create the target table with sql_types and its indexes when it does not exist yet, a no-op otherwise
+
+        Example:
+        device_loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipantDevices', key='device_id', columns=DEVICE_COLUMNS,
+                                      parent_key='participant_id', sql_types=DEVICE_SQL_TYPES)
+        device_loader.create_table()
+        """
+
+        if not self.sql_types:
+            raise Exception(f'No sql_types given for {self.table_name}, cannot create it, exiting')
+
+        with self.engine.begin() as conn:
+            exists = conn.execute(f"SELECT OBJECT_ID('{self.table_name}', 'U')").scalar() is not None
+            if not exists:
+                conn.execute(f"CREATE TABLE {self.table_name} ({', '.join(f'{c} {self.sql_types[c]}' for c in self.columns)})")
+                self.__create_indexes(conn, self.table_name)
+        if not exists:
+            logging.info(f'Created {self.table_name}.')
+
+
+    def create_staging(self):
+        """To create an empty {table_name}_staging table with the columns of the target table
+
+        Any staging table left behind by a failed run is dropped first.
+        """
+
+        with self.engine.begin() as conn:
+            conn.execute(f"IF OBJECT_ID('{self.staging_table_name}', 'U') IS NOT NULL DROP TABLE {self.staging_table_name}")
+            conn.execute(f"SELECT TOP 0 {', '.join(self.columns)} INTO {self.staging_table_name} FROM {self.table_name}")
+        logging.info(f'Created {self.staging_table_name}.')
+
+
+    def count(self, table_name=None):
+        """To count the rows of the target table
+
+        Parameter:
+        table_name : str
+            table to count, default value is the target table
+            example :
+                loader.staging_table_name
+
+        Return:
+        int
+            number of rows
+
+        Example:
+        if loader.count(loader.staging_table_name) < loader.count():
+            print('staging table holds fewer participants than the live table')
+        """
+
+        table_name = table_name or self.table_name
+        with self.engine.connect() as conn:
+            return int(conn.execute(f'SELECT COUNT_BIG(*) FROM {table_name}').scalar())
+
+
+    def swap_staging(self, *loaders):
+        """To build the indexes on the staging tables and swap them in as the target tables
+
+        The renames of all tables run in one short transaction, so readers see either the previous
+        snapshot or the new one of every table, never an empty or half-loaded table, nor new participants
+        next to old devices. The previous snapshots are kept as {table_name}_old until the next swap, see
+        restore_previous.
+
+        The staging table is a copy of the columns only, the renames do not carry over GRANTs on the
+        target table, its triggers, constraints other than NOT NULL, or indexes other than the ones built
+        here. Grant on the schema, or reapply them after the swap.
+
+        Parameter:
+        loaders : WakoopaLoader
+            other loaders whose staging tables are swapped in the same transaction, on the same engine
+            example :
+                device_loader
+
+        Example:
+        loader.create_staging()
+        device_loader.create_staging()
+        loader.insert(df, table_name=loader.staging_table_name)
+        device_loader.insert(devices, table_name=device_loader.staging_table_name)
+        loader.swap_staging(device_loader)
+        """
+
+        loaders = (self,) + loaders
+        for loader in loaders:
+            with self.engine.begin() as conn:
+                loader.__create_indexes(conn, loader.staging_table_name)
+
+        with self.engine.begin() as conn:
+            for loader in loaders:
+                conn.execute(f"IF OBJECT_ID('{loader.old_table_name}', 'U') IS NOT NULL DROP TABLE {loader.old_table_name}")
+                conn.execute(f"EXEC sp_rename '{loader.table_name}', '{loader.old_table_name}'")
+                conn.execute(f"EXEC sp_rename '{loader.staging_table_name}', '{loader.table_name}'")
+        for loader in loaders:
+            logging.info(f'Swapped {loader.staging_table_name} in as {loader.table_name}, previous snapshot kept as {loader.old_table_name}.')
+
+
+    def restore_previous(self, *loaders):
+        """To roll the target tables back to the snapshots kept by the last swap_staging
+
+        The current table and {table_name}_old exchange names, so calling it twice undoes the rollback.
+
+        Parameter:
+        loaders : WakoopaLoader
+            other loaders rolled back in the same transaction, see swap_staging
+
+        Example:
+        from WakoopaLoader import WakoopaLoader
+        loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipants')
+        loader.restore_previous()
+        """
+
+        loaders = (self,) + loaders
+        with self.engine.begin() as conn:
+            for loader in loaders:
+                swap_table_name = f'{loader.table_name}_swap'
+                conn.execute(f"EXEC sp_rename '{loader.table_name}', '{swap_table_name}'")
+                conn.execute(f"EXEC sp_rename '{loader.old_table_name}', '{loader.table_name}'")
+                conn.execute(f"EXEC sp_rename '{swap_table_name}', '{loader.old_table_name}'")
+        for loader in loaders:
+            logging.info(f'Restored {loader.old_table_name} as {loader.table_name}.')
+
+
+    def __rows(self, df):
+        """To convert a DataFrame to a list of parameter rows in columns order, NaN/NaT become NULL
+
+        Categories become their values and datetime64 columns become datetime.datetime, the types the
+        drivers bind natively.
+        """
+
+        df = df[self.columns]
+        columns = {}
+        for column in self.columns:
+            if df[column].dtype.kind == 'M':
+                # microsecond precision converts to datetime.datetime, NaT to None
+                columns[column] = df[column].values.astype('datetime64[us]').astype(object)
+            else:
+                columns[column] = df[column].astype(object).where(df[column].notna(), None).values
+        return [list(row) for row in zip(*columns.values())]
+
+
+    def __executemany(self, cursor, table_name, rows, tablock=False):
+        """To insert rows with one array-bound parameter batch
+
+        fast_executemany makes pyodbc send the whole batch as a parameter array in a single round trip
+        instead of one INSERT per row. TABLOCK allows minimally logged inserts into a heap nobody else reads,
+        such as the staging table.
+        """
+
+        hint = ' WITH (TABLOCK)' if tablock else ''
+        sql_query = f"INSERT INTO {table_name}{hint} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})"
+        # only pyodbc cursors have fast_executemany, other DB-API drivers (e.g. sqlite3 in the benchmarks) batch on their own
+        if hasattr(cursor, 'fast_executemany'):
+            cursor.fast_executemany = True
+        cursor.executemany(sql_query, rows)
+
+
+    def insert(self, df, table_name=None):
+        """To append a DataFrame to the target table as one bulk batch
+
+        Parameter:
+        df : pandas.DataFrame
+            rows with the columns of the target table
+        table_name : str
+            table to insert into, default value is the target table
+            example :
+                loader.staging_table_name
+
+        Return:
+        float
+            rows per second achieved for the batch
+
+        Example:
+        rows_per_sec = loader.insert(df)
+        """
+
+        table_name = table_name or self.table_name
+        if len(df) == 0:
+            return 0.0
+
+        start = time.perf_counter()
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            self.__executemany(cursor, table_name, self.__rows(df), tablock=table_name == self.staging_table_name)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = len(df) / elapsed if elapsed > 0 else float(len(df))
+        logging.info(f'Inserted {len(df)} rows into {table_name} in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec).')
+        return rows_per_sec
+
+
+    def delete(self, ids, column=None):
+        """To delete rows by id from the target table as one array-bound batch
+
+        Parameter:
+        ids : list
+            ids to delete
+        column : str
+            column matched against ids, default value is key
+            example :
+                'participant_id'
+
+        Example:
+        loader.delete([1001, 1002])
+        """
+
+        column = column or self.key
+
+        ids = [[participant_id] for participant_id in ids]
+        if len(ids) == 0:
+            return
+
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            if hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True
+            cursor.executemany(f'DELETE FROM {self.table_name} WHERE {column} = ?', ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        logging.info(f'Deleted {len(ids)} rows from {self.table_name}.')
+
+
+    def upsert(self, df, replace_ids=None):
+        """To merge a DataFrame into the target table keyed on id
+
+        The rows are loaded into the {table_name}_delta table and applied with a single set-based MERGE
+        in the same transaction: existing ids are updated, new ids are inserted, nothing is deleted
+        unless replace_ids is given.
+
+        Parameter:
+        df : pandas.DataFrame
+            rows with the columns of the target table
+        replace_ids : list
+            optional ids of parent_key whose rows are deleted first in the same transaction, so rows of these
+            parents missing from df are removed, e.g. the devices a participant no longer has
+
+        Return:
+        float
+            rows per second achieved for the batch
+
+        Example:
+        rows_per_sec = loader.upsert(df)
+        """
+
+        columns = [c for c in self.columns if c != self.key]
+        update_set = ', '.join(f't.{c} = s.{c}' for c in columns)
+        insert_columns = ', '.join(self.columns)
+        insert_values = ', '.join(f's.{c}' for c in self.columns)
+        replace_ids = [[parent_id] for parent_id in (replace_ids if replace_ids is not None else [])]
+        if replace_ids and not self.parent_key:
+            raise Exception(f'No parent_key given for {self.table_name}, cannot replace rows, exiting')
+        if len(df) == 0 and len(replace_ids) == 0:
+            return 0.0
+
+        start = time.perf_counter()
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            if replace_ids:
+                if hasattr(cursor, 'fast_executemany'):
+                    cursor.fast_executemany = True
+                cursor.executemany(f'DELETE FROM {self.table_name} WHERE {self.parent_key} = ?', replace_ids)
+            if len(df) > 0:
+                cursor.execute(f"IF OBJECT_ID('{self.delta_table_name}', 'U') IS NULL "
+                               f"SELECT TOP 0 {insert_columns} INTO {self.delta_table_name} FROM {self.table_name}")
+                cursor.execute(f'TRUNCATE TABLE {self.delta_table_name}')
+                self.__executemany(cursor, self.delta_table_name, self.__rows(df))
+                cursor.execute(f'MERGE {self.table_name} WITH (HOLDLOCK) AS t '
+                               f'USING {self.delta_table_name} AS s ON t.{self.key} = s.{self.key} '
+                               f'WHEN MATCHED THEN UPDATE SET {update_set} '
+                               f'WHEN NOT MATCHED BY TARGET THEN INSERT ({insert_columns}) VALUES ({insert_values});')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = len(df) / elapsed if elapsed > 0 else float(len(df))
+        logging.info(f'Merged {len(df)} rows into {self.table_name} in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec).')
+        return rows_per_sec
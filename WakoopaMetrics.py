@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class WakoopaMetrics:
+
+    def __init__(self):
+        """To initialise run metrics, a set of named stages accumulating duration, rows and bytes
+
+        A stage can be entered many times, for example once per batch, its spans are summed up.
+
+        Example:
+        from WakoopaMetrics import WakoopaMetrics
+        metrics = WakoopaMetrics()
+        with metrics.stage('insert') as span:
+            loader.insert(df)
+            span['rows'] = len(df)
+        print(metrics.condensed())
+        metrics.save('tWakoopaParticipant_metrics.json')
+        """
+
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+
+    def add(self, name, seconds=0.0, rows=0, bytes=0, calls=1):
+        """To add one span to a stage, thread safe"""
+
+        with self.lock:
+            stage = self.stages.setdefault(name, {'seconds' : 0.0, 'calls' : 0, 'rows' : 0, 'bytes' : 0})
+            stage['seconds'] += seconds
+            stage['calls'] += calls
+            stage['rows'] += rows
+            stage['bytes'] += bytes
+
+
+    def count(self, name, value):
+        """To record a named count of the run, such as the number of new participants"""
+
+        with self.lock:
+            self.counts[name] = value
+
+
+    @contextmanager
+    def stage(self, name):
+        """To time a span of a stage, rows and bytes can be set on the yielded dict"""
+
+        span = {'rows' : 0, 'bytes' : 0}
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.add(name, seconds=time.perf_counter() - start, rows=span['rows'], bytes=span['bytes'])
+
+
+    def timed(self, name, iterable):
+        """To time the wait on every item of iterable as a span of a stage, each item counts as one row
+
+        Used on the participants generator, so the stage measures how long the import waited on the API.
+        """
+
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, seconds=time.perf_counter() - start, calls=0)
+                return
+            self.add(name, seconds=time.perf_counter() - start, rows=1, calls=0)
+            yield item
+
+
+    def summary(self):
+        """To get the metrics of the run
+
+        Return:
+        dict
+            run start, total seconds, counts and per stage seconds, calls, rows, bytes and rows_per_sec
+        """
+
+        with self.lock:
+            stages = {name : dict(stage) for name, stage in self.stages.items()}
+            counts = dict(self.counts)
+
+        for stage in stages.values():
+            stage['rows_per_sec'] = round(stage['rows'] / stage['seconds'], 1) if stage['rows'] and stage['seconds'] > 0 else None
+            stage['seconds'] = round(stage['seconds'], 3)
+
+        return {
+            'started_at' : self.started_at.isoformat(timespec='seconds'),
+            'total_seconds' : round(time.perf_counter() - self.start, 3),
+            'counts' : counts,
+            'stages' : stages,
+        }
+
+
+    def condensed(self):
+        """To get a one line summary of the run, for tLog messages and emails
+
+        Example:
+        'total 42.1s | 12 new, 30 updated, 2 deleted | fetch 30.2s 12000 rows 48.3MB | transform 2.1s 12000 rows (5714/s) | insert 8.9s 12000 rows (1348/s)'
+        """
+
+        summary = self.summary()
+        parts = [f"total {summary['total_seconds']:.1f}s"]
+        if summary['counts']:
+            parts.append(', '.join(f'{value} {name}' for name, value in summary['counts'].items()))
+        for name, stage in summary['stages'].items():
+            part = f"{name} {stage['seconds']:.1f}s"
+            if stage['rows']:
+                part += f" {stage['rows']} rows"
+            if stage['bytes']:
+                part += f" {stage['bytes'] / 2**20:.1f}MB"
+            if stage['rows_per_sec'] and name != 'fetch':
+                part += f" ({stage['rows_per_sec']:.0f}/s)"
+            parts.append(part)
+        return ' | '.join(parts)
+
+
+    def save(self, filename):
+        """To write the summary as JSON"""
+
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+
+
+_DONE = object()
+
+
+class WakoopaPipeline:
+
+    def __init__(self, maxsize=2):
+        """To initialise a pipeline of stages running concurrently, connected by bounded queues
+
+        The source and every stage run in their own thread, the caller consumes the output of the last
+        stage. A full queue blocks the stage before it, so a slow database writer holds back transform and
+        fetch instead of letting batches pile up in memory. The first error of any stage stops the others
+        and is raised to the caller.
+
+        Parameter:
+        maxsize : int
+            batches buffered between two stages, default value is 2
+
+        Example:
+        from WakoopaPipeline import WakoopaPipeline
+        pipeline = WakoopaPipeline(maxsize=2)
+        for df in pipeline.run(chunked(participants, 10000), transform):
+            loader.insert(df)
+        """
+
+        self.maxsize = maxsize
+        self.stop = None
+        self.error = None
+
+
+    def __put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+    def __get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+
+    def __fail(self, e):
+        if self.error is None:
+            self.error = e
+            logging.exception(f'Pipeline stage failed: {e}')
+        self.stop.set()
+
+
+    def __source(self, iterable, output):
+        try:
+            for item in iterable:
+                if not self.__put(output, item):
+                    return
+            self.__put(output, _DONE)
+        except Exception as e:
+            self.__fail(e)
+
+
+    def __stage(self, function, input, output):
+        try:
+            while True:
+                item = self.__get(input)
+                if item is _DONE:
+                    self.__put(output, _DONE)
+                    return
+                if not self.__put(output, function(item)):
+                    return
+        except Exception as e:
+            self.__fail(e)
+
+
+    def run(self, source, *stages):
+        """To run source and stages concurrently and yield the output of the last stage
+
+        Parameter:
+        source : iterable
+            batches fed into the first stage, iterated in its own thread
+        stages : function
+            one function per stage, each takes the output of the previous stage and returns its own
+
+        Return:
+        generator
+            output of the last stage, in source order
+        """
+
+        # every run starts afresh, the same pipeline can run again after a run finished, failed or was stopped
+        self.stop = threading.Event()
+        self.error = None
+        queues = [queue.Queue(maxsize=self.maxsize) for m in range(len(stages) + 1)]
+        threads = [threading.Thread(target=self.__source, args=(source, queues[0]), name='pipeline-source', daemon=True)]
+        for i, function in enumerate(stages):
+            threads.append(threading.Thread(target=self.__stage, args=(function, queues[i], queues[i + 1]),
+                                            name=f'pipeline-{getattr(function, "__name__", i)}', daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self.__get(queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # stops the upstream stages when the consumer fails or stops early
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,185 @@
+import logging
+from datetime import datetime
+
+from WakoopaLoader import COLUMNS, DEVICE_COLUMNS, TAG_DELIMITER
+from WakoopaTransform import LOGIN_URL_PARAMETER
+
+
+def participant_schema():
+    """To build the explicit Spark schema of the raw /participants/ records, only the fields the import reads
+
+    Return:
+    pyspark.sql.types.StructType
+    """
+
+    from pyspark.sql.types import StructType, StructField, ArrayType, LongType, StringType
+
+    parameter = StructType([StructField('id', StringType()), StructField('contents', StringType())])
+    device = StructType([StructField('id', LongType()), StructField('platform', StringType()), StructField('created_at', StringType())])
+    return StructType([
+        StructField('id', LongType()),
+        StructField('tags', ArrayType(StringType())),
+        StructField('time_zone', StringType()),
+        StructField('created_at', StringType()),
+        StructField('links', StructType([StructField('configuration_parameters', ArrayType(parameter))])),
+        StructField('devices', ArrayType(device)),
+    ])
+
+
+class WakoopaSpark:
+
+    def __init__(self, jdbc_url=None, properties=None, master='local[*]', partitions=None, packages=None, app_name='tWakoopaParticipant'):
+        """To initialise the Spark engine of the participant import, an alternative to the pandas transform and pyodbc loader for large panels
+
+        Parameter:
+        jdbc_url : str
+            JDBC URL of the target database, only needed by write
+            example :
+                'jdbc:sqlserver://xxx;databaseName=xxx;encrypt=false'
+        properties : dict
+            JDBC connection properties, user, password and driver
+        master : str
+            Spark master, default value is 'local[*]' (one executor thread per core of this machine)
+        partitions : int
+            parallel JDBC connections of a write, default value is the default parallelism of the session, the
+            driver holds one more connection to the table while they write
+        packages : str
+            optional Maven coordinates of the JDBC driver, passed as spark.jars.packages
+            example :
+                'com.microsoft.sqlserver:mssql-jdbc:12.4.2.jre8'
+        app_name : str
+            Spark application name
+
+        Example:
+        from WakoopaSpark import WakoopaSpark
+        spark = WakoopaSpark(jdbc_url='jdbc:sqlserver://xxx;databaseName=xxx', properties={'user' : 'xxx', 'password' : 'xxx'})
+        records = spark.create_frame(participants)
+        spark.write(spark.transform(records), 'tWakoopaParticipants_staging')
+        spark.stop()
+        """
+
+        from pyspark.sql import SparkSession
+
+        # timestamps are kept in UTC like the pandas path, which parses created_at to naive UTC. The session
+        # time zone does not reach JDBC, which converts to java.sql.Timestamp in the default time zone of
+        # the JVM, so the driver and executor JVMs run in UTC too
+        builder = (SparkSession.builder.master(master).appName(app_name)
+                   .config('spark.sql.session.timeZone', 'UTC')
+                   .config('spark.driver.extraJavaOptions', '-Duser.timezone=UTC')
+                   .config('spark.executor.extraJavaOptions', '-Duser.timezone=UTC'))
+        if packages:
+            builder = builder.config('spark.jars.packages', packages)
+        self.spark = builder.getOrCreate()
+        # a JVM started before this session keeps its time zone, the options above only apply to a new one
+        jvm_time_zone = self.spark.sparkContext._jvm.java.util.TimeZone.getDefault().getID()
+        if jvm_time_zone not in ('UTC', 'Etc/UTC'):
+            raise Exception(f'Spark JVM runs in {jvm_time_zone}, JDBC writes would shift created_at, start it with -Duser.timezone=UTC, exiting')
+        self.jdbc_url = jdbc_url
+        self.properties = properties or {}
+        self.partitions = partitions or self.spark.sparkContext.defaultParallelism
+        logging.info(f'Started Spark {self.spark.version} on {master} with {self.partitions} write partitions.')
+
+
+    def create_frame(self, participants):
+        """To load a batch of raw API participant records into a Spark DataFrame with participant_schema
+
+        The records keep their API order in a _position column, devices use it to keep the last
+        occurrence of a device like the pandas path.
+
+        Parameter:
+        participants : list
+            participant dicts as returned by Wakoopa.get_participants without project
+
+        Return:
+        pyspark.sql.DataFrame
+        """
+
+        from pyspark.sql import functions as F
+
+        return self.spark.createDataFrame(participants, schema=participant_schema()).withColumn('_position', F.monotonically_increasing_id())
+
+
+    def transform(self, records):
+        """To project raw participant records to the columns of tWakoopaParticipants with native column expressions
+
+        profile_url is the contents of the first configuration parameter with id configurator_login_url, null
+        when links is null or has no such parameter, tags are joined with TAG_DELIMITER and created_at is
+        parsed to a UTC timestamp, the same as WakoopaTransform.transform. import_date is the local date of
+        the driver, as in pandas, not the UTC date of the session.
+
+        Parameter:
+        records : pyspark.sql.DataFrame
+            frame returned by create_frame
+
+        Return:
+        pyspark.sql.DataFrame
+            frame with COLUMNS
+        """
+
+        from pyspark.sql import functions as F
+
+        logins = F.filter(F.col('links.configuration_parameters'), lambda parameter: parameter['id'] == F.lit(LOGIN_URL_PARAMETER))
+        df = records.select(
+            F.lit(datetime.today().date()).alias('import_date'),
+            'id',
+            F.when(F.col('tags').isNotNull(), F.concat_ws(TAG_DELIMITER, 'tags')).alias('tags'),
+            'time_zone',
+            F.to_timestamp('created_at').alias('created_at'),
+            F.when(F.size(logins) > 0, logins.getItem(0)['contents']).alias('profile_url'),
+        )
+        return df.select(*COLUMNS)
+
+
+    def transform_devices(self, records):
+        """To flatten the devices of raw participant records into rows of tWakoopaParticipantDevices
+
+        A device listed twice keeps its last occurrence, the same as WakoopaTransform.transform_devices.
+
+        Parameter:
+        records : pyspark.sql.DataFrame
+            frame returned by create_frame
+
+        Return:
+        pyspark.sql.DataFrame
+            frame with DEVICE_COLUMNS
+        """
+
+        from pyspark.sql import functions as F
+        from pyspark.sql.window import Window
+
+        devices = records.select('_position', F.col('id').alias('participant_id'), F.posexplode('devices').alias('_device_position', 'device'))
+        last = Window.partitionBy(F.col('device.id')).orderBy(F.desc('_position'), F.desc('_device_position'))
+        df = devices.withColumn('_rank', F.row_number().over(last)).where(F.col('_rank') == 1).select(
+            F.lit(datetime.today().date()).alias('import_date'),
+            'participant_id',
+            F.col('device.id').alias('device_id'),
+            F.col('device.platform').alias('platform'),
+            F.to_timestamp('device.created_at').alias('created_at'),
+        )
+        return df.select(*DEVICE_COLUMNS)
+
+
+    def write(self, df, table_name):
+        """To append a frame to a table through parallel JDBC connections, one per partition
+
+        The driver opens one more connection to check the table and keeps it open until the partitions are
+        written, a write holds partitions + 1 connections to the database.
+
+        Parameter:
+        df : pyspark.sql.DataFrame
+            frame with the columns of table_name
+        table_name : str
+            table to append to
+            example :
+                'tWakoopaParticipants_staging'
+        """
+
+        df.repartition(self.partitions).write.jdbc(url=self.jdbc_url, table=table_name, mode='append',
+                                                   properties=dict(self.properties, numPartitions=str(self.partitions)))
+        logging.info(f'Wrote to {table_name} through {self.partitions} JDBC partitions.')
+
+
+    def stop(self):
+        """To stop the Spark session"""
+
+        self.spark.stop()
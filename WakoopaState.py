@@ -0,0 +1,46 @@
+import json
+import os
+
+
+class WakoopaState:
+
+    def __init__(self, filename):
+        """To initialise a small JSON state file kept between runs
+
+        Parameter:
+        filename : str
+            path of the JSON state file, it is created on first save
+            example :
+                'state/tWakoopaParticipant.json'
+
+        Example:
+        from WakoopaState import WakoopaState
+        state = WakoopaState('state/tWakoopaParticipant.json')
+        state.set('watermark', '2024-03-21T06:15:28Z')
+        print(state.get('watermark'))
+        """
+
+        self.filename = filename
+        self.values = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                self.values = json.load(f)
+
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+    def set(self, key, value):
+        """To set a value and persist the state file
+
+        The file is written to a temporary file first and then renamed, so a crash never leaves a
+        half-written state file behind.
+        """
+
+        self.values[key] = value
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        tmp_filename = f'{self.filename}.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.values, f, indent=4, default=str)
+        os.replace(tmp_filename, self.filename)
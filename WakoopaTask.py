@@ -0,0 +1,507 @@
+import hmac
+import hashlib
+import codecs
+import importlib.util
+import json
+import re
+import string
+import random
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+
+# Server errors worth asking again, the request is a GET so repeating it is safe
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+
+class WakoopaRateLimitError(Exception):
+    """Raised when the API answers 429 Too Many Requests"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WakoopaTransientError(Exception):
+    """Raised on a connection error, a timeout or a 5xx, the request is retried with backoff"""
+
+
+def parse_retry_after(value, default=1.0):
+    """To convert a Retry-After header to seconds to wait
+
+    Parameter:
+    value : str
+        header value, either seconds or an HTTP-date
+        example :
+            '30'
+            'Wed, 21 Oct 2015 07:28:00 GMT'
+    default : float
+        seconds returned when the header is missing or cannot be parsed, default value is 1
+
+    Return:
+    float
+        seconds to wait, 0 for a date in the past
+    """
+
+    from email.utils import parsedate_to_datetime
+
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logging.warning(f'Unparseable Retry-After {value!r}, waiting {default}s.')
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def iter_json_array(chunks, key):
+    """To yield the items of the array under key from a JSON document arriving as byte chunks
+
+    Only the item being decoded and the unread rest of the current chunk are held in memory, the
+    document is never materialized as a whole.
+
+    Parameter:
+    chunks : iterable
+        bytes chunks of a UTF-8 JSON document
+        example :
+            response.iter_content(chunk_size=65536)
+    key : str
+        key of the array, the first occurrence in the document is used
+        example :
+            'participants'
+
+    Return:
+    generator
+        decoded array item
+
+    Example:
+    from WakoopaTask import iter_json_array
+    for participant in iter_json_array(response.iter_content(chunk_size=65536), 'participants'):
+        print(participant['id'])
+    """
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    whitespace = re.compile(r'[\s,]*')
+
+    def read():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        return text_decoder.decode(chunk)
+
+    buffer = ''
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        text = read()
+        if text is None:
+            return
+        # keep a tail in case the key is split across two chunks
+        buffer = buffer[-(len(key) + 64):] + text
+
+    pos = 0
+    while True:
+        pos = whitespace.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        try:
+            if pos == len(buffer):
+                raise ValueError('need more data')
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            text = read()
+            if text is None:
+                raise Exception(f'Truncated JSON document while reading {key}')
+            buffer = buffer[pos:] + text
+            pos = 0
+            continue
+
+        yield item
+
+
+class Wakoopa:
+
+    def __init__(self, client, secret, base_url='https://wakoopa.wkp.io/api/v1', cache=None, replay=False, read_cache=False, metrics=None,
+                 timeout=(10, 60), retries=4, backoff=1.0, max_backoff=60.0, pool_size=16, rate_limit_retries=10):
+        """To initialise Wakoopa API client
+
+        Parameter:
+        client : str
+            Wakoopa API key
+        secret : str
+            Wakoopa API secret used to sign every request
+        base_url : str
+            Wakoopa API root, default value is https://wakoopa.wkp.io/api/v1
+        cache : WakoopaCache
+            optional on-disk response cache, every response that parsed is written to it
+        replay : bool
+            default value is False, True serves pages from cache only and fails on a page not cached
+        read_cache : bool
+            default value is False, every page is requested from the API, True serves the pages found in
+            cache instead, for a rerun or a resumed run that should not request them again, implied by replay
+        metrics : WakoopaMetrics
+            optional run metrics, decoded bytes of every page are added to its fetch stage, latency and
+            bytes on the wire of every request to its request stage and backoff waits to its retry stage
+        timeout : tuple
+            connect and read timeout in seconds, default value is (10, 60), the read timeout applies to
+            every wait on the socket so a stalled response fails instead of hanging the run
+        retries : int
+            attempts after a connection error, a timeout or a 5xx before the error is raised, default value is 4
+        backoff : float
+            upper bound in seconds of the first retry wait, doubled on each further retry, the actual wait
+            is drawn uniformly below it so parallel workers do not retry in step, default value is 1
+        max_backoff : float
+            cap of the retry wait in seconds, default value is 60
+        pool_size : int
+            keep-alive connections kept open to the API, default value is 16
+        rate_limit_retries : int
+            429 responses in a row, without any page fetched in between, before the run gives up instead of
+            waiting for the API forever, default value is 10
+
+        Example:
+        from WakoopaTask import Wakoopa
+        w = Wakoopa(client='xxx', secret='xxx')
+        w.close()
+        """
+
+        self.client = client
+        self.secret = secret
+        self.base_url = base_url
+        self.cache = cache
+        self.replay = replay
+        self.read_cache = read_cache or replay
+        self.metrics = metrics
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.rate_limit_retries = rate_limit_retries
+        self.session = None
+        self.session_lock = threading.Lock()
+        # last page handed out by a paged request, recorded in import checkpoints
+        self.last_page = None
+        if replay and cache is None:
+            raise Exception('Replay mode needs a response cache, exiting')
+
+
+    def __session(self):
+        """To get the pooled keep-alive session shared by every request, it is created on first use"""
+
+        import requests
+
+        with self.session_lock:
+            if self.session is None:
+                self.session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+                # urllib3 only decodes brotli when a brotli package is installed
+                encodings = ['gzip', 'deflate'] + (['br'] if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi') else [])
+                self.session.headers['Accept-Encoding'] = ', '.join(encodings)
+            return self.session
+
+
+    def close(self):
+        """To close the keep-alive connections of the session"""
+
+        with self.session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+
+    def __random_string(self, length):
+        return ''.join(random.choice(string.ascii_letters) for m in range(length))
+
+
+    def __signed_params(self):
+        """To compute nonce, timestamp and HMAC signature for a single API request
+
+        Return:
+        dict
+            api_key, nonce, timestamp and signature query parameters
+        """
+
+        utc_timestamp = int(datetime.now(timezone.utc).timestamp())
+        nonce = self.__random_string(15)
+        message = str(utc_timestamp) + nonce
+        signature = hmac.new(bytes(self.secret, 'latin-1'), msg=bytes(message, 'latin-1'), digestmod=hashlib.sha256).hexdigest()
+        return {'api_key' : self.client, 'nonce' : nonce, 'timestamp' : utc_timestamp, 'signature' : signature}
+
+
+    def get_page(self, endpoint, page, per_page, key=None, project=None, **params):
+        """To get one page of an API endpoint
+
+        Parameter:
+        endpoint : str
+            API endpoint under base_url
+            example :
+                'participants'
+        page : int
+            page number, starting from 1
+        per_page : int
+            number of records per page
+        key : str
+            key of the record list in the response, only used with project
+        project : function
+            when given, the response is decoded as a stream and every record under key is passed through
+            project as soon as it is decoded, only the projected records are kept
+        params : dict
+            extra query parameters
+            example :
+                {'date_from' : '2023-03-31', 'include' : 'devices'}
+
+        Return:
+        dict
+            parsed JSON response, or {key : list of projected records} with project
+        """
+
+        query = dict(params)
+        query['page'] = page
+        query['per_page'] = per_page
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self.__read_page(endpoint, page, query, key=key, project=project)
+            except WakoopaTransientError as e:
+                if attempt == self.retries:
+                    raise Exception(f'{e}, giving up after {self.retries} retries, exiting')
+                wait = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+                logging.warning(f'{e}, retry {attempt + 1} of {self.retries} in {wait:.1f}s.')
+                if self.metrics is not None:
+                    self.metrics.add('retry', seconds=wait)
+                time.sleep(wait)
+
+
+    def __read_page(self, endpoint, page, query, key=None, project=None):
+        """To read one page from the cache or with one signed request, see get_page
+
+        A fresh nonce, timestamp and signature are computed on every call, so a retry is never rejected
+        as a replayed request.
+        """
+
+        response = None
+        network_errors = ()
+        chunks = None
+        writer = None
+        if self.cache is not None:
+            cache_key = self.cache.key(endpoint, dict(query, api_key=self.client))
+            if self.read_cache:
+                chunks = self.cache.read(cache_key)
+
+        if chunks is None:
+            if self.replay:
+                raise Exception(f'Replay mode: {endpoint} page {page} is not cached, exiting')
+
+            import requests
+            network_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+            try:
+                response = self.__session().get(f"{self.base_url}/{endpoint}/", params=dict(query, **self.__signed_params()),
+                                                stream=True, timeout=self.timeout)
+            except network_errors as e:
+                raise WakoopaTransientError(f'{type(e).__name__} on {endpoint} page {page}') from e
+
+            if response.status_code == 429:
+                response.close()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                raise WakoopaRateLimitError(f'Error: 429 on {endpoint} page {page}, retry after {retry_after}s', retry_after)
+
+            if response.status_code in RETRY_STATUS_CODES:
+                response.close()
+                raise WakoopaTransientError(f'Error: {response.status_code} on {endpoint} page {page}')
+
+            # Status code 200 means successful
+            if response.status_code != 200:
+                response.close()
+                raise Exception(f'Error: {response.status_code} on {endpoint} page {page}, exiting')
+
+            chunks = response.iter_content(chunk_size=65536)
+            if self.cache is not None:
+                writer = self.cache.write(cache_key, chunks)
+                chunks = iter(writer)
+
+        if self.metrics is not None:
+            chunks = self.__count_bytes(chunks)
+
+        try:
+            if project is not None:
+                records = [project(record) for record in iter_json_array(chunks, key)]
+                # read to the end so the cache entry is completed
+                for chunk in chunks:
+                    pass
+                result = {key : records}
+            else:
+                result = json.loads(b''.join(chunks))
+        except BaseException as e:
+            # the body stalled, broke off or does not parse, it is not cached
+            if writer is not None:
+                writer.discard()
+            if isinstance(e, network_errors):
+                raise WakoopaTransientError(f'{type(e).__name__} reading {endpoint} page {page}') from e
+            raise
+        finally:
+            if response is not None:
+                response.close()
+
+        if writer is not None:
+            writer.commit()
+
+        if response is not None and self.metrics is not None:
+            # latency until the headers arrived, bytes as sent on the wire, compressed when negotiated
+            self.metrics.add('request', seconds=response.elapsed.total_seconds(), bytes=response.raw.tell())
+        return result
+
+
+    def __count_bytes(self, chunks):
+        for chunk in chunks:
+            self.metrics.add('fetch', bytes=len(chunk), calls=0)
+            yield chunk
+
+
+    def __get_pages(self, endpoint, key, per_page, max_workers, project=None, start_page=1, **params):
+        """To get pages of an endpoint with up to max_workers requests in flight, in page order
+
+        Pages are requested in windows of the current worker count and yielded strictly in page
+        order, up to the first empty page. A 429 halves the worker count, waits for Retry-After and refetches from the throttled
+        page onwards. Every window completed without throttling adds one worker back, up to max_workers.
+        After rate_limit_retries 429s in a row without a page fetched, the run gives up.
+
+        Parameter:
+        endpoint : str
+            API endpoint under base_url
+        key : str
+            key of the record list in the response
+            example :
+                'participants'
+        per_page : int
+            page size requested from the API
+        max_workers : int
+            maximum number of pages fetched concurrently, 1 fetches pages one after another
+        project : function
+            optional projection applied while streaming each page, see get_page
+        start_page : int
+            first page requested, default value is 1
+        params : dict
+            extra query parameters
+
+        Return:
+        generator
+            list of records per page
+        """
+
+        workers = max_workers
+        next_page = start_page
+        short_page = None
+        rate_limited = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                window_start = next_page
+                window = range(next_page, next_page + workers)
+                logging.info(f'Retrieving {endpoint} pages {window[0]} to {window[-1]} with page size of {per_page}.')
+                futures = [executor.submit(self.get_page, endpoint, page, per_page, key=key, project=project, **params) for page in window]
+
+                retry_after = None
+                for page, future in zip(window, futures):
+                    try:
+                        records = future.result().get(key, [])
+                    except WakoopaRateLimitError as e:
+                        retry_after = e.retry_after
+                        break
+
+                    # a short page is not proof of the last one, the API may cap the page size, only an empty page ends the pull
+                    if len(records) == 0:
+                        return
+                    if short_page is not None:
+                        if start_page > 1:
+                            raise Exception(f'{endpoint} page {short_page} had fewer than {per_page} records but more pages follow, the API caps '
+                                            f'the page size, the pages to skip from page {start_page} cannot be trusted, exiting')
+                        logging.warning(f'{endpoint} page {short_page} had fewer than {per_page} records but more pages follow, the API caps the page size.')
+                        short_page = None
+                    if len(records) < per_page:
+                        short_page = page
+
+                    self.last_page = page
+                    yield records
+                    next_page = page + 1
+
+                if retry_after is not None:
+                    # rounds throttled before fetching any page, the API may never let the run through
+                    rate_limited = rate_limited + 1 if next_page == window_start else 0
+                    if rate_limited > self.rate_limit_retries:
+                        raise Exception(f'Rate limited on {endpoint} page {next_page} {rate_limited} times in a row, giving up, exiting')
+                    workers = max(1, workers // 2)
+                    logging.warning(f'Rate limited on {endpoint} page {next_page}, lowering concurrency to {workers} and waiting {retry_after}s.')
+                    time.sleep(retry_after)
+                else:
+                    rate_limited = 0
+                    workers = min(max_workers, workers + 1)
+
+
+    def get_participants(self, date_from, per_page=1000, include='devices', max_workers=1, project=None, skip=0):
+        """To get participants page by page, yielding one participant record at a time
+
+        At most max_workers pages are held in memory at a time. Paging stops at the first page that
+        returns no records, a short page does not end it as the API may return fewer than per_page
+        records per page.
+
+        Parameter:
+        date_from : str
+            only participants from this date onwards
+            example :
+                '2023-03-31'
+        per_page : int
+            page size requested from the API
+        include : str
+            related resources to include, pass None to skip
+            example :
+                'devices'
+        max_workers : int
+            maximum number of pages fetched concurrently, default value is 1 (one page after another)
+        project : function
+            when given, pages are decoded as a stream and each participant is replaced by project(participant)
+            as soon as it is decoded
+            example :
+                WakoopaTransform.project_participant
+        skip : int
+            participants to skip, default value is 0, the pages holding them entirely are not requested at all,
+            used to resume an import after the participants it already committed
+
+        Return:
+        generator
+            participant dict as returned by the API, or as returned by project
+
+        Example:
+        from WakoopaTask import Wakoopa
+        w = Wakoopa(client='xxx', secret='xxx')
+        for participant in w.get_participants(date_from='2023-03-31', per_page=500, max_workers=4):
+            print(participant['id'])
+        """
+
+        params = {'date_from' : date_from}
+        if include:
+            params['include'] = include
+
+        start_page = skip // per_page + 1
+        skip = skip % per_page
+        for participants in self.__get_pages('participants', 'participants', per_page, max_workers, project=project, start_page=start_page, **params):
+            for participant in participants[skip:]:
+                yield participant
+            skip = 0
@@ -0,0 +1,255 @@
+import logging
+from datetime import datetime
+
+from WakoopaLoader import COLUMNS, DEVICE_COLUMNS, DTYPES, DEVICE_DTYPES, TAG_DELIMITER
+
+
+LOGIN_URL_PARAMETER = 'configurator_login_url'
+
+# Columns that identify a change of a participant, import_date is left out on purpose
+HASH_COLUMNS = ['id', 'tags', 'time_zone', 'created_at', 'profile_url']
+
+# Format of the stored watermark, created_at in UTC
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Columns that identify a change of a device, part of the hash of its participant when devices are imported
+DEVICE_HASH_COLUMNS = ['participant_id', 'device_id', 'platform', 'created_at']
+
+
+def extract_profile_url(links):
+    """To extract the configurator login URL from the nested links of every participant in one pass
+
+    links['configuration_parameters'] of all participants is exploded into one column of parameters,
+    flattened into a frame and filtered on id, no Python loop runs per participant. A participant whose
+    links is null, lacks configuration_parameters or has no configurator_login_url gets None.
+
+    Parameter:
+    links : pandas.Series
+        links column of the participants frame, one dict per participant
+
+    Return:
+    pandas.Series
+        login URL per participant, aligned on the index of links
+
+    Example:
+    from WakoopaTransform import extract_profile_url
+    df['profile_url'] = extract_profile_url(df['links'])
+    """
+
+    import pandas as pd
+
+    # pd.Series(None, dtype=object) would hold NaN, the row-wise apply returned None
+    profile_url = pd.Series([None] * len(links), index=links.index, dtype=object)
+
+    params = links.str.get('configuration_parameters').explode().dropna()
+    if len(params) == 0:
+        return profile_url
+
+    params = pd.DataFrame(params.tolist(), index=params.index)
+    if 'id' not in params or 'contents' not in params:
+        return profile_url
+
+    urls = params.loc[params['id'] == LOGIN_URL_PARAMETER, 'contents']
+    urls = urls[~urls.index.duplicated(keep='first')]
+    profile_url.loc[urls.index] = urls
+    return profile_url
+
+
+def apply_schema(df, dtypes):
+    """To convert the columns of a frame to the compact types of dtypes, in place
+
+    Lists of tags are joined with TAG_DELIMITER, datetime64 columns are parsed from the ISO strings of the
+    API to naive UTC, unparseable values become NaT.
+
+    Parameter:
+    df : pandas.DataFrame
+        frame with the columns of dtypes
+    dtypes : dict
+        column to dtype, DTYPES or DEVICE_DTYPES
+
+    Return:
+    pandas.DataFrame
+        df with its columns in dtypes order
+
+    Example:
+    from WakoopaLoader import DTYPES
+    from WakoopaTransform import apply_schema
+    df = apply_schema(pd.DataFrame(participants), DTYPES)
+    """
+
+    import pandas as pd
+
+    if 'tags' in dtypes and df['tags'].map(lambda tags: isinstance(tags, list)).any():
+        df['tags'] = df['tags'].str.join(TAG_DELIMITER)
+
+    for column, dtype in dtypes.items():
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column], utc=True, errors='coerce').dt.tz_localize(None)
+        elif dtype != 'object':
+            df[column] = df[column].astype(dtype)
+    return df[list(dtypes)]
+
+
+def project_participant(participant, include_devices=False):
+    """To reduce one API participant record to the fields written to tWakoopaParticipants
+
+    Used as the projection of the streaming decoder, so links and devices are dropped as soon as each
+    participant is decoded.
+
+    Parameter:
+    participant : dict
+        participant record as returned by the API
+    include_devices : bool
+        default value is False, True keeps the devices reduced to the fields of tWakoopaParticipantDevices
+
+    Return:
+    dict
+        id, tags, time_zone, created_at and profile_url, plus devices with include_devices
+
+    Example:
+    from functools import partial
+    from WakoopaTransform import project_participant
+    participants = w.get_participants(date_from='2023-03-31', project=project_participant)
+    participants = w.get_participants(date_from='2023-03-31', project=partial(project_participant, include_devices=True))
+    """
+
+    profile_url = None
+    try:
+        for param in participant['links']['configuration_parameters']:
+            if param.get('id') == LOGIN_URL_PARAMETER:
+                profile_url = param.get('contents')
+                break
+    except (KeyError, TypeError, AttributeError):
+        pass
+
+    projected = {
+        'id' : participant.get('id'),
+        'tags' : participant.get('tags'),
+        'time_zone' : participant.get('time_zone'),
+        'created_at' : participant.get('created_at'),
+        'profile_url' : profile_url,
+    }
+    if include_devices:
+        projected['devices'] = [{'id' : device.get('id'), 'platform' : device.get('platform'), 'created_at' : device.get('created_at')}
+                                for device in participant.get('devices') or []]
+    return projected
+
+
+def transform(participants):
+    """To project a batch of API participant records to the columns of tWakoopaParticipants
+
+    Parameter:
+    participants : list
+        participant dicts as returned by Wakoopa.get_participants, either raw API records or already
+        reduced by project_participant
+
+    Return:
+    pandas.DataFrame
+        frame with COLUMNS typed as DTYPES
+
+    Example:
+    from WakoopaTransform import transform
+    df = transform(participants)
+    """
+
+    import pandas as pd
+
+    df = pd.DataFrame(participants)
+    if 'profile_url' not in df:
+        df['profile_url'] = extract_profile_url(df['links']) if 'links' in df else None
+
+    missing = int(df['profile_url'].isna().sum())
+    if missing > 0:
+        logging.warning(f'{missing} of {len(df)} participants have no {LOGIN_URL_PARAMETER} in links.')
+
+    df['import_date'] = datetime.today().date()
+    return apply_schema(df, DTYPES)[COLUMNS]
+
+
+def transform_devices(participants):
+    """To flatten the devices of a batch of participants into rows of tWakoopaParticipantDevices
+
+    The devices lists of all participants are exploded into one column and normalized into columns in one
+    pass. A device listed twice keeps its last occurrence.
+
+    Parameter:
+    participants : list
+        participant dicts with devices, raw API records or reduced by project_participant with include_devices
+
+    Return:
+    pandas.DataFrame
+        frame with DEVICE_COLUMNS typed as DEVICE_DTYPES
+
+    Example:
+    from WakoopaTransform import transform_devices
+    devices = transform_devices(participants)
+    """
+
+    import pandas as pd
+
+    df = pd.DataFrame(participants, columns=['id', 'devices']).explode('devices').dropna(subset=['devices'])
+    devices = pd.DataFrame(df['devices'].tolist(), columns=['id', 'platform', 'created_at'])
+    devices.insert(0, 'participant_id', df['id'].values)
+    devices = devices.rename(columns={'id' : 'device_id'}).drop_duplicates(subset='device_id', keep='last')
+    devices['import_date'] = datetime.today().date()
+    return apply_schema(devices, DEVICE_DTYPES)[DEVICE_COLUMNS]
+
+
+def row_hash(df, devices=None):
+    """To compute a stable 64-bit content hash per participant over HASH_COLUMNS, vectorized
+
+    Every column is hashed through its string representation, so categories and timestamps hash the same
+    whatever their in-memory type. With devices, the hashes of the devices of a participant over
+    DEVICE_HASH_COLUMNS are summed, which does not depend on their order, and mixed into its hash, so
+    a device added, changed or removed changes the hash of its participant.
+
+    Parameter:
+    df : pandas.DataFrame
+        frame with HASH_COLUMNS, as returned by transform
+    devices : pandas.DataFrame
+        optional devices of the participants of df, as returned by transform_devices
+
+    Return:
+    pandas.Series
+        uint64 hash per row, indexed by id
+
+    Example:
+    from WakoopaTransform import transform, transform_devices, row_hash
+    hashes = row_hash(transform(participants), transform_devices(participants))
+    """
+
+    import pandas as pd
+
+    hashes = pd.util.hash_pandas_object(df[HASH_COLUMNS].astype(str), index=False)
+    if devices is not None:
+        device_hashes = pd.util.hash_pandas_object(devices[DEVICE_HASH_COLUMNS].astype(str), index=False)
+        # uint64 sums wrap around, a participant without devices gets 0
+        per_participant = device_hashes.groupby(devices['participant_id'].values).sum()
+        combined = pd.DataFrame({'participant' : hashes.values,
+                                 'devices' : per_participant.reindex(df['id'].values, fill_value=0).values.astype('uint64')})
+        hashes = pd.util.hash_pandas_object(combined, index=False)
+    hashes.index = df['id'].values
+    return hashes
+
+
+def latest_created_at(created_at):
+    """To get the latest created_at as a watermark, in UTC with WATERMARK_FORMAT whatever the offset of the input
+
+    Parameter:
+    created_at : iterable
+        ISO strings of the API or naive UTC timestamps, as returned by transform
+
+    Return:
+    str
+        latest created_at, None when there is none
+
+    Example:
+    from WakoopaTransform import transform, latest_created_at
+    watermark = latest_created_at(transform(participants)['created_at'])
+    watermark = latest_created_at(participant.get('created_at') for participant in participants)
+    """
+
+    import pandas as pd
+
+    created_at = pd.to_datetime(pd.Series(list(created_at), dtype=object), utc=True, errors='coerce').dropna()
+    return created_at.max().strftime(WATERMARK_FORMAT) if len(created_at) else None
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from WakoopaTransform import extract_profile_url
+from synthetic import make_panel
+
+
+def extract_url(row):
+    """Row-wise extraction used by tWakoopaParticipant.py before WakoopaTransform, kept as the baseline
+
+    TypeError is caught as well so the null links in the synthetic panel do not abort the benchmark.
+    """
+
+    try:
+        for param in row['links']['configuration_parameters']:
+            if param['id'] == 'configurator_login_url':
+                return param['contents']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def best_of(repeat, func):
+    timings = []
+    for m in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare row-wise apply and vectorized profile_url extraction.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'participants':>12} {'apply (s)':>10} {'vectorized (s)':>15} {'speedup':>8}")
+    for size in args.sizes:
+        df = pd.DataFrame(make_panel(size, devices=0))
+        apply_time, expected = best_of(args.repeat, lambda: df.apply(extract_url, axis=1))
+        vector_time, result = best_of(args.repeat, lambda: extract_profile_url(df['links']))
+
+        if not expected.fillna('').equals(result.fillna('')):
+            sys.exit(f'Results differ for {size} participants')
+
+        print(f'{size:>12} {apply_time:>10.3f} {vector_time:>15.3f} {apply_time / vector_time:>7.1f}x')
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from WakoopaLoader import COLUMNS
+from WakoopaTransform import transform, project_participant
+from synthetic import make_panel
+
+
+def bytes_per_participant(df):
+    """To measure the deep memory of a frame per row, Python objects held by object columns included
+
+    pandas only counts the list object itself for columns of lists, the strings in the lists are added here.
+
+    Return:
+    dict
+        column to bytes per row, plus total
+    """
+
+    usage = df.memory_usage(deep=True, index=False)
+    for column in df.columns:
+        if df[column].dtype == object and df[column].map(lambda value: isinstance(value, list)).any():
+            usage[column] += df[column].map(lambda value: sum(map(sys.getsizeof, value)) if isinstance(value, list) else 0).sum()
+    usage = usage / len(df)
+    result = {column : usage[column] for column in df.columns}
+    result['total'] = usage.sum()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report bytes per participant of the participants frame before and after the compact DTYPES schema.')
+    parser.add_argument('--size', type=int, default=100000, help='participants in the synthetic panel')
+    args = parser.parse_args()
+
+    participants = [project_participant(p) for p in make_panel(args.size, devices=0)]
+
+    # previous representation: the projected records as plain object columns, tags as lists
+    before = pd.DataFrame(participants)
+    before['import_date'] = pd.Timestamp.today().date()
+    before = before[COLUMNS]
+    after = transform(participants)
+
+    before, after = bytes_per_participant(before), bytes_per_participant(after)
+    print(f"{'column':>12} {'before':>8} {'after':>8}   bytes per participant")
+    for column in COLUMNS + ['total']:
+        print(f'{column:>12} {before[column]:>8.1f} {after[column]:>8.1f}')
+    print(f"{args.size} participants: {before['total'] * args.size / 2**20:.1f}MB -> {after['total'] * args.size / 2**20:.1f}MB")
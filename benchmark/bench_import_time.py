@@ -0,0 +1,65 @@
+import argparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules tWakoopaParticipant.py imports before its first stage runs
+ENTRY_POINT_MODULES = ['config', 'SGTAMProdTask', 'WakoopaTask', 'WakoopaLoader', 'WakoopaTransform', 'WakoopaState',
+                       'WakoopaCache', 'WakoopaMetrics', 'WakoopaChanges', 'WakoopaPipeline', 'WakoopaBatching', 'WakoopaSpark']
+
+# Heavy dependencies that must only be imported by the stage that needs them
+HEAVY_MODULES = ['pandas', 'numpy', 'sqlalchemy', 'requests', 'pyspark', 'pyarrow', 'smtplib']
+
+# Cold-start budget of ENTRY_POINT_MODULES, also enforced by tests/test_import_time.py
+BUDGET_MS = 100.0
+
+
+def import_time(modules):
+    """To import modules in a fresh interpreter with -X importtime
+
+    Return:
+    dict
+        top level module name to cumulative import time in microseconds
+    """
+
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                               cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = cumulative.get(name.strip(), 0) + int(cumulative_us)
+    return cumulative
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report cold-start import time of the tWakoopaParticipant entry point and fail past a budget.')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='maximum cumulative import time of the entry point modules')
+    parser.add_argument('--repeat', type=int, default=5, help='best of repeat fresh interpreters')
+    args = parser.parse_args()
+
+    runs = [import_time(ENTRY_POINT_MODULES) for m in range(args.repeat)]
+    best = min(runs, key=lambda run: sum(run.get(module, 0) for module in ENTRY_POINT_MODULES))
+
+    total_ms = sum(best.get(module, 0) for module in ENTRY_POINT_MODULES) / 1000
+    for module in ENTRY_POINT_MODULES:
+        print(f'{module:>20} {best.get(module, 0) / 1000:8.1f} ms')
+    print(f"{'total':>20} {total_ms:8.1f} ms (budget {args.budget_ms:.1f} ms)")
+
+    failures = []
+    loaded_heavy = [module for module in HEAVY_MODULES if module in best]
+    if loaded_heavy:
+        failures.append(f'heavy modules imported at startup: {loaded_heavy}')
+    if total_ms > args.budget_ms:
+        failures.append(f'cold-start import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms')
+
+    if failures:
+        sys.exit('FAILED: ' + '; '.join(failures))
+    print('OK')
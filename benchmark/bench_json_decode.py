@@ -0,0 +1,59 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from WakoopaTask import iter_json_array
+from WakoopaTransform import transform, project_participant
+from synthetic import make_panel
+
+
+CHUNK_SIZE = 65536
+
+
+def full_document(payload):
+    """Previous path: response.json() then pd.DataFrame(data['participants'])"""
+
+    data = json.loads(payload)
+    return transform(data['participants'])
+
+
+def streaming(payload):
+    """Streaming path: decode participants one by one and keep only the projected fields"""
+
+    chunks = (payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE))
+    return transform([project_participant(participant) for participant in iter_json_array(chunks, 'participants')])
+
+
+def measure(func, payload):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func(payload)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare peak memory of full-document and streaming JSON decoding of a participants page.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--devices', type=int, default=3, help='devices per participant')
+    args = parser.parse_args()
+
+    print(f"{'participants':>12} {'payload MB':>10} {'full MB':>8} {'stream MB':>9} {'full (s)':>8} {'stream (s)':>10}")
+    for size in args.sizes:
+        payload = json.dumps({'participants' : make_panel(size, devices=args.devices)}).encode('utf-8')
+        full_time, full_peak, expected = measure(full_document, payload)
+        stream_time, stream_peak, result = measure(streaming, payload)
+
+        if not expected.drop(columns='import_date').equals(result.drop(columns='import_date')):
+            sys.exit(f'Results differ for {size} participants')
+
+        print(f'{size:>12} {len(payload) / 2**20:>10.1f} {full_peak / 2**20:>8.1f} {stream_peak / 2**20:>9.1f} {full_time:>8.2f} {stream_time:>10.2f}')
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from sqlalchemy import create_engine
+
+from WakoopaTask import Wakoopa, iter_json_array
+from WakoopaLoader import WakoopaLoader
+from WakoopaTransform import transform, project_participant
+from WakoopaPipeline import WakoopaPipeline
+from mock_wakoopa import MockWakoopa
+
+
+TABLE_NAME = 'tWakoopaParticipants'
+
+
+class Stages:
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.results = []
+
+
+    @contextmanager
+    def stage(self, name):
+        """To time a stage and record its peak traced memory above what was allocated when it started"""
+
+        result = {'stage' : name, 'rows' : None}
+        if self.memory:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield result
+        result['seconds'] = time.perf_counter() - start
+        if self.memory:
+            result['peak_mb'] = (tracemalloc.get_traced_memory()[1] - baseline) / 2**20
+        if result['rows']:
+            result['rows_per_sec'] = result['rows'] / result['seconds'] if result['seconds'] > 0 else None
+        self.results.append(result)
+
+
+    def print(self):
+        print(f"{'stage':>20} {'rows':>9} {'seconds':>9} {'rows/sec':>10} {'peak MB':>8}")
+        for r in self.results:
+            rows = '' if r['rows'] is None else r['rows']
+            rows_per_sec = '' if r.get('rows_per_sec') is None else f"{r['rows_per_sec']:.0f}"
+            peak_mb = '' if 'peak_mb' not in r else f"{r['peak_mb']:.1f}"
+            print(f"{r['stage']:>20} {rows:>9} {r['seconds']:>9.3f} {rows_per_sec:>10} {peak_mb:>8}")
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def create_table(engine):
+    with engine.begin() as conn:
+        conn.execute(f'DROP TABLE IF EXISTS {TABLE_NAME}')
+        conn.execute(f'CREATE TABLE {TABLE_NAME} (import_date TEXT, id INTEGER, tags TEXT, time_zone TEXT, created_at TEXT, profile_url TEXT)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the participant import against a local Wakoopa API stand-in and a SQLite target, '
+                                                 'reporting time and peak memory per stage.')
+    parser.add_argument('--size', type=int, default=50000, help='participants in the synthetic panel')
+    parser.add_argument('--devices', type=int, default=2, help='devices per participant')
+    parser.add_argument('--per-page', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the mock API sleeps per response')
+    parser.add_argument('--stream', action='store_true', help='parse with the streaming decoder and projection')
+    parser.add_argument('--queue-size', type=int, default=2, help='batches buffered between the stages of end_to_end_pipelined')
+    parser.add_argument('--db', default=None, help='SQLAlchemy URL of the target, default is a temporary SQLite file')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, which slows every stage down')
+    parser.add_argument('--json', default=None, help='write the results to this JSON file for comparison across commits')
+    args = parser.parse_args()
+
+    stages = Stages(memory=not args.no_memory)
+    engine = create_engine(args.db or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    create_table(engine)
+    loader = WakoopaLoader(engine=engine, table_name=TABLE_NAME)
+
+    with MockWakoopa(size=args.size, devices=args.devices, latency=args.latency) as api:
+        api.prerender(args.per_page)
+        if stages.memory:
+            tracemalloc.start()
+
+        with stages.stage('fetch') as r:
+            session = requests.Session()
+            pages = [session.get(f'{api.base_url}/participants/', params={'page' : page, 'per_page' : args.per_page, 'include' : 'devices'}).content
+                     for page in range(1, args.size // args.per_page + 2)]
+            r['rows'] = args.size
+            r['bytes'] = sum(len(page) for page in pages)
+
+        with stages.stage('parse') as r:
+            if args.stream:
+                participants = [project_participant(p) for page in pages for p in iter_json_array([page], 'participants')]
+            else:
+                participants = [p for page in pages for p in json.loads(page)['participants']]
+            r['rows'] = len(participants)
+        del pages
+
+        with stages.stage('extract_url') as r:
+            frames = [transform(batch) for batch in batches(participants, args.batch_size)]
+            r['rows'] = sum(len(df) for df in frames)
+        del participants
+
+        # yesterday's snapshot for the delete stage to clear, loaded outside of any stage
+        for df in frames:
+            loader.insert(df)
+
+        with stages.stage('delete') as r:
+            with engine.begin() as conn:
+                r['rows'] = conn.execute(f'DELETE FROM {TABLE_NAME}').rowcount
+
+        with stages.stage('insert') as r:
+            for df in frames:
+                loader.insert(df)
+            r['rows'] = sum(len(df) for df in frames)
+        del frames
+
+        with stages.stage('end_to_end') as r:
+            wakoopa = Wakoopa(client='bench', secret='bench', base_url=api.base_url)
+            participants = wakoopa.get_participants(date_from='2023-03-31', per_page=args.per_page, max_workers=args.max_workers,
+                                                    project=project_participant if args.stream else None)
+            with engine.begin() as conn:
+                conn.execute(f'DELETE FROM {TABLE_NAME}')
+            r['rows'] = 0
+            for batch in batches(participants, args.batch_size):
+                df = transform(batch)
+                loader.insert(df)
+                r['rows'] += len(df)
+
+        # same run with fetch, transform and insert overlapped, wall time should approach the slowest stage
+        with stages.stage('end_to_end_pipelined') as r:
+            wakoopa = Wakoopa(client='bench', secret='bench', base_url=api.base_url)
+            participants = wakoopa.get_participants(date_from='2023-03-31', per_page=args.per_page, max_workers=args.max_workers,
+                                                    project=project_participant if args.stream else None)
+            with engine.begin() as conn:
+                conn.execute(f'DELETE FROM {TABLE_NAME}')
+            r['rows'] = 0
+            for df in WakoopaPipeline(maxsize=args.queue_size).run(batches(participants, args.batch_size), transform):
+                loader.insert(df)
+                r['rows'] += len(df)
+
+        if stages.memory:
+            tracemalloc.stop()
+
+    stages.print()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args' : vars(args), 'stages' : stages.results}, f, indent=4)
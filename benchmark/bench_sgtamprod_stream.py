@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sql
+
+from SGTAMProdTask import SGTAMProd
+
+
+DATABASE = 'bench'
+
+# tLog shaped rows, few task ids and status flags, messages repeat a lot
+DTYPE = {'logTaskID' : 'int32', 'statusFlag' : 'int8', 'logMsg' : 'category'}
+
+
+def create_tlog(engine, rows):
+    with engine.begin() as con:
+        con.execute('DROP TABLE IF EXISTS tLog')
+        con.execute('CREATE TABLE tLog (logID TEXT, logTaskID INTEGER, statusFlag INTEGER, logMsg TEXT, logDtTime TEXT)')
+        con.execute(sql.text('INSERT INTO tLog VALUES (:logID, :logTaskID, :statusFlag, :logMsg, :logDtTime)'),
+                    [{'logID' : f'{i:036d}', 'logTaskID' : i % 200, 'statusFlag' : i % 3,
+                      'logMsg' : f'Task {i % 200} completed', 'logDtTime' : f'2024-03-{1 + i % 28:02d} 06:00:00'} for i in range(rows)])
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, seconds, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare time and peak memory of reading tLog with execute_query_to_df against execute_query_to_df_chunks.')
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of a local database with a tLog table, default is a temporary SQLite file filled with --rows rows')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--chunksize', type=int, default=50000)
+    args = parser.parse_args()
+
+    s = SGTAMProd()
+    engine = sql.create_engine(args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    if args.url is None:
+        create_tlog(engine, args.rows)
+    # point SGTAMProd at the benchmark database instead of the production server
+    s.engines[DATABASE] = engine
+    sql_query = 'SELECT logID, logTaskID, statusFlag, logMsg, logDtTime FROM tLog'
+
+    results = {
+        'execute_query_to_df' : measure(lambda: len(s.execute_query_to_df(sql_query=sql_query, database=DATABASE))),
+        'chunks' : measure(lambda: sum(len(df) for df in s.execute_query_to_df_chunks(sql_query=sql_query, database=DATABASE, chunksize=args.chunksize))),
+        'chunks + dtype' : measure(lambda: sum(len(df) for df in s.execute_query_to_df_chunks(sql_query=sql_query, database=DATABASE, chunksize=args.chunksize, dtype=DTYPE))),
+        'chunks as rows' : measure(lambda: sum(len(rows) for rows in s.execute_query_to_df_chunks(sql_query=sql_query, database=DATABASE, chunksize=args.chunksize, as_rows=True))),
+    }
+
+    print(f"{'read':>20} {'rows':>9} {'seconds':>9} {'peak MB':>8}")
+    for name, (rows, seconds, peak) in results.items():
+        print(f'{name:>20} {rows:>9} {seconds:>9.3f} {peak / 2**20:>8.1f}')
+    s.close()
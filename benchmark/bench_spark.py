@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from WakoopaTransform import transform, transform_devices, latest_created_at
+from WakoopaSpark import WakoopaSpark
+from synthetic import make_panel
+
+
+def compare(name, expected, actual, key):
+    """To check a Spark result against the pandas one row for row, categories compared by value"""
+
+    expected = expected.sort_values(key).reset_index(drop=True)
+    actual = actual.sort_values(key).reset_index(drop=True)
+    # pandas keeps missing values of object columns as None, Spark returns NaN for some of them
+    expected = expected.astype(object).where(expected.notna(), None)
+    actual = actual.astype(object).where(actual.notna(), None)[expected.columns]
+
+    if expected.shape != actual.shape or not expected.equals(actual):
+        mismatches = (expected != actual).any(axis=1).sum() if expected.shape == actual.shape else 'shape'
+        sys.exit(f'{name}: Spark result differs from pandas ({mismatches} rows)')
+    print(f'{name}: {len(actual)} rows identical to pandas')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the Spark engine matches the pandas transform and compare their timings on a synthetic panel.')
+    parser.add_argument('--size', type=int, default=200000, help='participants in the synthetic panel')
+    parser.add_argument('--devices', type=int, default=2, help='devices per participant')
+    parser.add_argument('--master', default='local[*]')
+    parser.add_argument('--jdbc-url', default=None, help='optionally also time a parallel JDBC write into --table, '
+                                                         'example: jdbc:sqlserver://localhost;databaseName=bench;encrypt=false')
+    parser.add_argument('--table', default='tWakoopaParticipants_staging')
+    parser.add_argument('--user', default=None)
+    parser.add_argument('--password', default=None)
+    args = parser.parse_args()
+
+    participants = make_panel(args.size, args.devices)
+
+    start = time.perf_counter()
+    expected = transform(participants)
+    expected_devices = transform_devices(participants)
+    print(f'pandas transform          : {time.perf_counter() - start:8.3f} s')
+
+    start = time.perf_counter()
+    spark = WakoopaSpark(jdbc_url=args.jdbc_url, properties={'user' : args.user, 'password' : args.password}, master=args.master)
+    print(f'spark start               : {time.perf_counter() - start:8.3f} s, JVM time zone '
+          f'{spark.spark.sparkContext._jvm.java.util.TimeZone.getDefault().getID()}')
+
+    start = time.perf_counter()
+    records = spark.create_frame(participants).cache()
+    actual = spark.transform(records).toPandas()
+    actual_devices = spark.transform_devices(records).toPandas()
+    print(f'spark transform (collect) : {time.perf_counter() - start:8.3f} s on {spark.partitions} partitions')
+
+    compare('participants', expected, actual, 'id')
+    compare('devices', expected_devices, actual_devices, 'device_id')
+
+    # the Spark engine takes its watermark from the raw API strings, the pandas path from the parsed frame
+    watermarks = latest_created_at(expected['created_at']), latest_created_at(participant.get('created_at') for participant in participants)
+    if watermarks[0] != watermarks[1]:
+        sys.exit(f'watermark: Spark {watermarks[1]} differs from pandas {watermarks[0]}')
+    print(f'watermark: {watermarks[0]} identical to pandas')
+
+    if args.jdbc_url:
+        start = time.perf_counter()
+        spark.write(spark.transform(records), args.table)
+        print(f'spark JDBC write          : {time.perf_counter() - start:8.3f} s')
+
+    spark.stop()
@@ -0,0 +1,94 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from synthetic import make_panel
+
+
+class MockWakoopa:
+
+    def __init__(self, size, devices=2, latency=0.0):
+        """To serve a synthetic panel on a local /api/v1/participants/ stand-in
+
+        Pages are rendered up front, so serving them costs no CPU in the benchmark process beyond the
+        socket writes. Responses follow the page and per_page query parameters and only carry devices
+        when include=devices is requested.
+
+        Parameter:
+        size : int
+            number of participants in the panel
+        devices : int
+            devices per participant
+        latency : float
+            seconds slept before every response, to mimic the API round trip
+
+        Example:
+        with MockWakoopa(size=10000) as api:
+            w = Wakoopa(client='bench', secret='bench', base_url=api.base_url)
+        """
+
+        self.panel = make_panel(size, devices)
+        self.latency = latency
+        self.rendered = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+
+    def render(self, page, per_page, include_devices):
+        key = (page, per_page, include_devices)
+        with self.lock:
+            if key not in self.rendered:
+                participants = self.panel[(page - 1) * per_page:page * per_page]
+                if not include_devices:
+                    participants = [{k : v for k, v in p.items() if k != 'devices'} for p in participants]
+                self.rendered[key] = json.dumps({'participants' : participants}).encode('utf-8')
+            return self.rendered[key]
+
+
+    def prerender(self, per_page, include_devices=True):
+        for page in range(1, len(self.panel) // per_page + 2):
+            self.render(page, per_page, include_devices)
+
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.rstrip('/') != '/api/v1/participants':
+                    self.send_error(404)
+                    return
+
+                query = parse_qs(url.query)
+                body = mock.render(int(query.get('page', ['1'])[0]), int(query.get('per_page', ['1000'])[0]),
+                                   query.get('include', [''])[0] == 'devices')
+                if mock.latency:
+                    threading.Event().wait(mock.latency)
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with mock.lock:
+                    mock.requests += 1
+                    mock.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/api/v1'
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,37 @@
+import random
+
+
+TIME_ZONES = ['Asia/Singapore', 'Asia/Kuala_Lumpur', 'Asia/Jakarta', 'Asia/Bangkok', 'Asia/Manila']
+
+
+def make_participant(i, devices=2):
+    """To make one synthetic participant shaped like the /api/v1/participants/ records
+
+    Every 50th participant has null links and every 20th has no configurator_login_url, so the
+    unexpected shapes are covered too.
+    """
+
+    if i % 50 == 0:
+        links = None
+    else:
+        parameters = [{'id' : 'panel_id', 'contents' : str(i)}]
+        if i % 20 != 0:
+            parameters.append({'id' : 'configurator_login_url', 'contents' : f'https://wakoopa.wkp.io/login/{i:010d}'})
+        links = {'self' : f'/api/v1/participants/{i}', 'configuration_parameters' : parameters}
+
+    return {
+        'id' : i,
+        'tags' : [f'tag{i % 7}', f'wave{i % 3}'],
+        'time_zone' : TIME_ZONES[i % len(TIME_ZONES)],
+        'created_at' : f'2023-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00Z',
+        'links' : links,
+        'devices' : [{'id' : i * 10 + d, 'platform' : random.choice(['android', 'ios', 'windows', 'mac']),
+                      'created_at' : '2023-04-01T00:00:00Z', 'last_seen_at' : '2024-03-21T00:00:00Z'}
+                     for d in range(devices)],
+    }
+
+
+def make_panel(size, devices=2):
+    """To make a list of size synthetic participants"""
+
+    return [make_participant(i, devices) for i in range(1, size + 1)]
@@ -18,3 +18,57 @@ SGTAM_log_config = {
                         'logID' : None
                     }
 
+
+wakoopa = {
+        'client' : 'xxx',
+        'secret' : 'xxx', # Wen Xuan's secret key
+        'date_from' : '2023-03-31',
+        'per_page' : 1000,
+        'max_workers' : 4,
+        'connect_timeout' : 10, # seconds
+        'read_timeout' : 60, # seconds without a byte from the API before the request is retried
+        'retries' : 4, # retries of a request after a connection error, a timeout or a 5xx, with jittered exponential backoff
+        'rate_limit_retries' : 10, # 429s in a row without a page fetched before the run gives up
+        'batch_size' : 10000, # starting batch size of the first run, later runs start from the size the previous run settled on
+        'batch_min_size' : 1000,
+        'batch_max_size' : 100000,
+        'batch_max_bytes' : 256 * 2**20, # bounds memory and the parameter array sent to the server per batch
+        'batch_max_seconds' : 60, # a slower batch is shrunk, keeps locks and the risk of timeouts short
+        'pipeline_queue_size' : 2, # batches buffered between fetch, transform and load, bounds memory when the database is the slow stage
+        'stream_json' : True, # decode API pages as a stream and keep only the projected fields
+        'import_devices' : False, # True loads devices into tWakoopaParticipantDevices, False does not request them at all
+        'cache_dir' : 'D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/cache',
+        'cache_ttl' : 86400,
+        'read_cache' : False, # True serves pages cached within cache_ttl instead of requesting them, --replay and --resume always do
+        'cache_max_bytes' : 512 * 2**20,
+        'state_file' : 'D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/state/tWakoopaParticipant.json',
+        'full_refresh_weekday' : 6, # Sunday, datetime.weekday()
+        'daily_mode' : 'incremental', # mode of the other days, incremental or changes
+        'max_delete_share' : 0.05, # changes mode aborts instead of deleting more than this share of the indexed participants, a full run instead of swapping in a staging table with this share fewer participants than the live table
+        'hash_index_file' : 'D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/state/tWakoopaParticipant_hashes.pkl.gz',
+        'engine' : 'pandas' # engine of full runs, pandas or spark
+    }
+
+# Panels imported by tWakoopaParticipantRunner.py, each one runs tWakoopaParticipant.py --client name
+wakoopa_clients = [
+        {
+            'name' : 'sg',
+            'client' : 'xxx',
+            'secret' : 'xxx',
+            'date_from' : '2023-03-31',
+            'table_name' : 'tWakoopaParticipants',
+            'device_table_name' : 'tWakoopaParticipantDevices',
+            'logTaskID' : 124
+        },
+    ]
+
+runner = {
+        'max_concurrency' : 2, # clients imported at the same time
+        'db_connections' : 8 # database connections shared by all running clients, at least 2 per client, 3 with the Spark engine
+    }
+
+spark = {
+        'master' : 'local[*]', # all cores of this machine
+        'partitions' : None, # parallel JDBC connections per write, None is one per core
+        'packages' : 'com.microsoft.sqlserver:mssql-jdbc:12.4.2.jre8' # JDBC driver fetched by Spark on first start
+    }
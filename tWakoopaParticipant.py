@@ -1,100 +1,151 @@
-import pandas as pd
-import requests
-import datetime
-import hmac
-import hashlib
-import string
-import random
 import logging
+import argparse
+import json
+import os
 from SGTAMProdTask import SGTAMProd
-from datetime import datetime, date, timedelta, timezone
+from WakoopaTask import Wakoopa
+from WakoopaLoader import WakoopaLoader, DEVICE_COLUMNS, DEVICE_SQL_TYPES
+from WakoopaTransform import transform, transform_devices, project_participant, latest_created_at
+from WakoopaState import WakoopaState
+from WakoopaCache import WakoopaCache
+from WakoopaMetrics import WakoopaMetrics
+from WakoopaChanges import WakoopaHashIndex
+from WakoopaPipeline import WakoopaPipeline
+from WakoopaBatching import WakoopaBatchSizer
+from functools import partial
+from datetime import datetime
 import config
-from sqlalchemy import create_engine
-from pyspark.sql import SparkSession, DataFrame
-from pyspark.sql.types import StructType, StructField, IntegerType, StringType, TimestampType, DateType
-from pyspark.sql.functions import lit, current_date, col, unix_timestamp, from_unixtime, date_format, current_timestamp
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--mode', choices=['full', 'incremental', 'changes'], default=None,
+                    help='full reloads the table through a staging table swap, incremental merges participants past the stored watermark, '
+                         'changes pulls every participant but only writes new, changed and deleted ones. '
+                         'Default is full on the weekly full refresh day or when no watermark is stored yet, else config daily_mode.')
+parser.add_argument('--replay', action='store_true',
+                    help='rebuild the table from the API responses cached by an earlier run, without calling the API.')
+parser.add_argument('--engine', choices=['pandas', 'spark'], default=None,
+                    help='engine of full runs, spark transforms each batch with Spark on config spark master and writes it through parallel JDBC connections. '
+                         'Incremental and changes runs always use pandas. Default is config engine.')
+parser.add_argument('--resume', action='store_true',
+                    help='continue an interrupted run after its last committed batch, with the mode and date_from of that run. '
+                         'Pages it already fetched are read from the response cache.')
+parser.add_argument('--client', default=None,
+                    help='name of the client in config wakoopa_clients to import, its credentials, date_from, tables and logTaskID replace the '
+                         'single client settings. Used by tWakoopaParticipantRunner.py.')
+parser.add_argument('--db-connections', type=int, default=None,
+                    help='database connections this run may hold, one for the SGTAM log and the rest for the target database, at least 3 with the Spark engine. '
+                         'Default is no cap.')
+parser.add_argument('--no-email', action='store_true', help='do not send the status email, the runner sends one for all clients.')
+parser.add_argument('--result-file', default=None, help='write status, rows and metrics of the run to this JSON file.')
+args = parser.parse_args()
+if args.db_connections is not None and args.db_connections < 2:
+    parser.error('--db-connections must be at least 2, one for the SGTAM log and one for the target database')
+metrics = WakoopaMetrics()
+formatted_date = datetime.today().strftime("%d %B %Y")
+result = {'client' : args.client, 'status' : 'ERROR', 'mode' : None, 'rows' : 0, 'message' : None}
+
+def client_filename(filename, name):
+    # state of each client is kept apart, e.g. tWakoopaParticipant.json -> tWakoopaParticipant_sg.json
+    directory, basename = os.path.split(filename)
+    stem, dot, extension = basename.partition('.')
+    return os.path.join(directory, f'{stem}_{name}{dot}{extension}')
+
+# Define the table names in your SQL Server database
+table_name = 'tWakoopaParticipants'
+device_table_name = 'tWakoopaParticipantDevices'
+log_prefix = 'tWakoopaParticipant'
+if args.client:
+    client = next((client for client in config.wakoopa_clients if client['name'] == args.client), None)
+    if client is None:
+        parser.error(f'unknown client {args.client}, see config wakoopa_clients')
+    config.wakoopa.update(client=client['client'], secret=client['secret'], date_from=client['date_from'],
+                          state_file=client_filename(config.wakoopa['state_file'], args.client),
+                          hash_index_file=client_filename(config.wakoopa['hash_index_file'], args.client))
+    config.SGTAM_log_config['logTaskID'] = client['logTaskID']
+    table_name = client['table_name']
+    device_table_name = client['device_table_name']
+    log_prefix = f'tWakoopaParticipant_{args.client}'
+
+# Closed in finally, any of them may not exist yet when the run fails early
+s = wakoopa = engine = None
 
 try:
     # Set up logging
-    log_filename = f"D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/log/tWakoopaParticipant_{datetime.now().strftime('%Y-%m-%d %H-%M-%S')}.txt"
+    log_filename = f"D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/log/{log_prefix}_{datetime.now().strftime('%Y-%m-%d %H-%M-%S')}.txt"
     logging.basicConfig(filename=log_filename, level=logging.INFO)
-    s = SGTAMProd()
+    # Under a connection budget the SGTAM log gets one connection, the target database the rest
+    s = SGTAMProd(**({'pool_size' : 1, 'max_overflow' : 0} if args.db_connections else {}))
 
     config.SGTAM_log_config['statusFlag'], config.SGTAM_log_config['logID']  = s.insert_tlog(**config.SGTAM_log_config)
 
     #------------------------------------------------------------------------------------------------------#
-    # Define functions                                                                                     #
-    #------------------------------------------------------------------------------------------------------#
-
-    def random_string(length):
-        return ''.join(random.choice(string.ascii_letters) for m in range(length))
-    #------------------------------------------------------------------------------------------------------#
-
-    #------------------------------------------------------------------------------------------------------#
-    # This part is to get data from API and store them in Pandas df first                                  #
+    # This part is to get data from API page by page, participants are consumed as they arrive             #
     #------------------------------------------------------------------------------------------------------#
-    current_time = datetime.now(timezone.utc)
-    utc_time = current_time.replace(tzinfo=timezone.utc)
-    utc_timestamp = int(utc_time.timestamp())
-    nonce = random_string(15)
-    message = str(utc_timestamp) + nonce
-    secret = 'xxx' # Wen Xuan's secret key 
-    signature = hmac.new(bytes(secret, 'latin-1'), msg=bytes(message, 'latin-1'), digestmod=hashlib.sha256).hexdigest()
-    client = 'xxx'
-    api_key = f"{client}&nonce={nonce}&timestamp={utc_timestamp}=&signature={signature}"
-
-    # Get details of all panelist
-    get_all_participants = ( f"https://wakoopa.wkp.io/api/v1/participants/?"
-                    f"&date_from='2023-03-31'"
-                    f"&per_page=999999999999"
-                    f"&include=devices"
-                    f"&api_key={client}&nonce={nonce}&timestamp={utc_timestamp}&signature={signature}" )
-
-    print(get_all_participants)
-
-    try:
-        print('Retrieving participants informations from the API')
-        logging.info('Retrieving participants informations from the API')
-
-        response = requests.get(get_all_participants)
-    
-        # Status code 200 means successful
-        if response.status_code == 200: 
-            # Parse the JSON response into a Python dictionar
-            print('Response status code is 200, connection to API is successful.')
-            logging.info('Response status code is 200, connection to API is successful.')
-
-            data = response.json()
+    cache = WakoopaCache(config.wakoopa['cache_dir'], ttl=config.wakoopa['cache_ttl'], max_bytes=config.wakoopa['cache_max_bytes'])
+    # Pages are only served from the cache when asked to, a daily run must see what changed since yesterday
+    wakoopa = Wakoopa(client=config.wakoopa['client'], secret=config.wakoopa['secret'], cache=cache, replay=args.replay,
+                      read_cache=args.resume or config.wakoopa['read_cache'], metrics=metrics,
+                      timeout=(config.wakoopa['connect_timeout'], config.wakoopa['read_timeout']),
+                      retries=config.wakoopa['retries'], pool_size=config.wakoopa['max_workers'],
+                      rate_limit_retries=config.wakoopa['rate_limit_retries'])
+    state = WakoopaState(config.wakoopa['state_file'])
+    hash_index = WakoopaHashIndex(config.wakoopa['hash_index_file'])
 
-            df = pd.DataFrame(data['participants'])
-            
+    # Weekly full refresh reconciles updates and deletions the incremental runs do not see
+    watermark = state.get('watermark')
+    checkpoint = state.get('checkpoint')
+    # Define page size and starting batch size, the batch size adapts to the database and is remembered for the next run
+    per_page = config.wakoopa['per_page']
+    chunksize = state.get('batch_size', config.wakoopa['batch_size'])
+    if args.resume:
+        if checkpoint is None:
+            raise Exception('No checkpoint stored, nothing to resume, exiting')
+        # A resumed run must page like the interrupted one to skip what it committed
+        mode = checkpoint['mode']
+        date_from = checkpoint['date_from']
+        per_page = checkpoint['per_page']
+        chunksize = checkpoint['batch_size']
+        # Only pandas runs checkpoint, see the Spark engine below
+        engine_name = 'pandas'
+        run_id = checkpoint['run_id']
+        print(f"Resuming run {run_id} after batch {checkpoint['last_batch_committed']}, {checkpoint['rows_committed']} rows committed, last page fetched {checkpoint['last_page_fetched']}.")
+        logging.info(f"Resuming run {run_id} after batch {checkpoint['last_batch_committed']}, {checkpoint['rows_committed']} rows committed, last page fetched {checkpoint['last_page_fetched']}.")
+    else:
+        if checkpoint is not None:
+            print(f"Discarding the checkpoint of interrupted run {checkpoint['run_id']}, starting over.")
+            logging.warning(f"Discarding the checkpoint of interrupted run {checkpoint['run_id']}, starting over.")
+            state.set('checkpoint', None)
+        hash_index.clear_progress()
+        mode = args.mode
+        if mode is None:
+            mode = 'full' if watermark is None or datetime.today().weekday() == config.wakoopa['full_refresh_weekday'] else config.wakoopa['daily_mode']
+        if mode == 'incremental' and watermark is None:
+            raise Exception('No watermark stored yet, run with --mode full first, exiting')
+        if mode == 'changes' and not hash_index.exists():
+            print('No participant hash index stored yet, falling back to full mode.')
+            logging.warning('No participant hash index stored yet, falling back to full mode.')
+            mode = 'full'
 
-        else:
-            raise Exception(f'Error: {response.status_code}, exiting')
+        # Incremental runs request from the watermark date, the overlap is absorbed by the MERGE on id
+        date_from = watermark[:10] if mode == 'incremental' else config.wakoopa['date_from']
+        # Spark only pays off when the whole panel is reloaded
+        engine_name = (args.engine or config.wakoopa['engine']) if mode == 'full' else 'pandas'
+        run_id = config.SGTAM_log_config['logID']
+        checkpoint = None
+        if engine_name == 'spark' and args.db_connections is not None and args.db_connections < 3:
+            raise Exception('The Spark engine needs --db-connections of at least 3, one for the SGTAM log, one for the JDBC driver '
+                            'and one per write partition, exiting')
+    print(f'Import mode: {mode}, engine: {engine_name}, date_from: {date_from}, replay: {args.replay}, resume: {args.resume}')
+    logging.info(f'Import mode: {mode}, engine: {engine_name}, date_from: {date_from}, replay: {args.replay}, resume: {args.resume}')
 
-    except requests.exceptions.RequestException as e:
-        raise e
-
-    # Assuming df is your DataFrame containing the column "links" with dictionaries
-    # Replace 'your_column_name' with the actual name of the column containing the dictionaries
-    # Replace 'your_desired_url_key' with the actual key for the desired URL within the dictionaries
-    def extract_url(row):
-        try:
-            for param in row['links']['configuration_parameters']:
-                #print(param)
-                if param['id'] == 'configurator_login_url':
-                    return param['contents']
-        except (KeyError, IndexError):
-            return None
-
-    # Apply the function to extract the URL
-    print('Extracting the profile links information from the nested dictionary.')
-    logging.info('Extracting the profile links information from the nested dictionary.')
-    df['links'] = df.apply(extract_url, axis=1)
-    df.rename(columns={'links': 'profile_url'}, inplace=True)
-    df['import_date'] = datetime.today().date()
-
-    df = df[['import_date','id','tags','time_zone','created_at','profile_url']]
+    # Get details of all panelist, devices are only requested when they are imported
+    import_devices = config.wakoopa['import_devices']
+    participants = wakoopa.get_participants(date_from=date_from,
+                                            per_page=per_page,
+                                            include='devices' if import_devices else None,
+                                            max_workers=config.wakoopa['max_workers'],
+                                            project=partial(project_participant, include_devices=import_devices) if config.wakoopa['stream_json'] and engine_name == 'pandas' else None,
+                                            skip=checkpoint['rows_committed'] if checkpoint else 0)
 
     # Define connection parameters
     server_name = 'xxx'
@@ -105,78 +156,280 @@ try:
     # Construct the connection string
     connection_string = f'mssql+pyodbc://{username}:{password}@{server_name}/{database_name}?driver=SQL+Server'
 
-    # Create SQLAlchemy engine
-    engine = create_engine(connection_string)
+    # Create SQLAlchemy engine, imported here so startup does not pay for it before it is needed
+    from sqlalchemy import create_engine
+    target_connections = args.db_connections - 1 if args.db_connections else None
+    engine = create_engine(connection_string, **({'pool_size' : target_connections, 'max_overflow' : 0} if target_connections else {}))
 
-    # Define the table name in your SQL Server database
-    table_name = 'tWakoopaParticipants'
+    loader = WakoopaLoader(engine=engine, table_name=table_name)
+    device_loader = WakoopaLoader(engine=engine, table_name=device_table_name, key='device_id', columns=DEVICE_COLUMNS,
+                                  parent_key='participant_id', sql_types=DEVICE_SQL_TYPES)
+    if import_devices:
+        device_loader.create_table()
 
-    # Define chunksize for processing data in chunks
-    chunksize = 50  # Adjust as needed based on your system's memory constraints
-
-    # Clear the table before importing data
-    print('Clearing tWakoopaParticipants table before data import.')
-    logging.info('Clearing tWakoopaParticipants table before data import.')
-    with engine.connect() as conn:
-        conn.execute(f'DELETE FROM {table_name}')
-
-    # Iterate over the DataFrame in chunks and perform batch insertion
-    print('Data import starting.')
-    logging.info('Data import starting.')
+    # Iterate over the API pages in chunks and perform batch insertion
+    print('Retrieving participants informations from the API and importing data.')
+    logging.info('Retrieving participants informations from the API and importing data.')
     total_rows_inserted = 0
     counter = 1
-    for chunk_start in range(0, len(df), chunksize):
-        chunk_end = min(chunk_start + chunksize, len(df))
-        chunk = df.iloc[chunk_start:chunk_end]
-        total_rows_inserted += len(chunk)
-        print(f"Insertion {counter} with chunk size of {len(chunk)} rows.")
-        logging.info(f"Insertion {counter} with chunk size of {len(chunk)} rows.")
-        # Insert chunk into the SQL table
-        chunk.to_sql(table_name, engine, if_exists='append', index=False)
-        counter += 1
+    max_created_at = watermark
+    if checkpoint:
+        # Carry on from the committed batches, the staging tables of a full run already hold them
+        total_rows_inserted = checkpoint['rows_committed']
+        counter = checkpoint['last_batch_committed'] + 1
+        max_created_at = checkpoint['max_created_at']
+        hash_index.load_progress(checkpoint['last_batch_committed'])
+    elif mode == 'full':
+        # Full refresh loads into a staging table, the live table stays readable until the swap
+        print(f'Creating {table_name} staging table before data import.')
+        logging.info(f'Creating {table_name} staging table before data import.')
+        with metrics.stage('staging'):
+            loader.create_staging()
+            if import_devices:
+                device_loader.create_staging()
+
+    def prepare(rows):
+        # Runs in the transform thread, overlapped with the API fetch and the database writes
+        with metrics.stage('transform') as span:
+            chunk = transform(rows)
+            span['rows'] = len(chunk)
+        devices = None
+        if import_devices:
+            with metrics.stage('transform_devices') as span:
+                devices = transform_devices(rows)
+                span['rows'] = len(devices)
+        with metrics.stage('hash') as span:
+            # the devices are part of the hash, a participant whose devices changed counts as updated
+            changed, batch = hash_index.diff(chunk, devices)
+            span['rows'] = len(chunk)
+        if import_devices and mode == 'changes':
+            # Devices follow their participants, changes mode only rewrites devices of changed participants
+            devices = devices[devices['participant_id'].isin(changed['id'])]
+        return chunk, changed, devices, batch
+
+    # Batch size climbs towards the best rows/sec of the writes, changes mode writes too few rows per batch to measure it
+    sizer = WakoopaBatchSizer(size=chunksize,
+                              min_size=config.wakoopa['batch_min_size'],
+                              max_size=config.wakoopa['batch_max_size'],
+                              max_bytes=config.wakoopa['batch_max_bytes'],
+                              max_seconds=config.wakoopa['batch_max_seconds'])
+    print(f'Starting batch size: {sizer.size}')
+    logging.info(f'Starting batch size: {sizer.size}')
+
+    def save_checkpoint(batch):
+        # Checkpoint after every committed batch, --resume carries on from here
+        with metrics.stage('checkpoint'):
+            hash_index.save_progress(counter, batch)
+            state.set('checkpoint', {'run_id' : run_id,
+                                     'mode' : mode,
+                                     'date_from' : date_from,
+                                     'per_page' : per_page,
+                                     'batch_size' : sizer.size,
+                                     'last_page_fetched' : wakoopa.last_page,
+                                     'last_batch_committed' : counter,
+                                     'rows_committed' : total_rows_inserted,
+                                     'max_created_at' : max_created_at,
+                                     'updated_at' : datetime.now().isoformat(timespec='seconds')})
+
+    if engine_name == 'spark':
+        # Spark transforms the raw records of each batch with column expressions and writes them to the
+        # staging tables through parallel JDBC connections, imported here as only full runs may need it.
+        # Each JDBC partition commits on its own, a batch is not atomic, so Spark runs do not checkpoint
+        # and an interrupted Spark run is rerun in full, the live table is untouched until the swap anyway.
+        from WakoopaSpark import WakoopaSpark
+        # The pooled connections of the staging tables would stay open next to the JDBC ones, the engine
+        # reconnects for the swap once Spark has stopped
+        engine.dispose()
+        with metrics.stage('spark_start'):
+            spark = WakoopaSpark(jdbc_url=f'jdbc:sqlserver://{server_name};databaseName={database_name};encrypt=false',
+                                 properties={'user' : username, 'password' : password, 'driver' : 'com.microsoft.sqlserver.jdbc.SQLServerDriver'},
+                                 master=config.spark['master'],
+                                 # the driver holds one more JDBC connection while the partitions write
+                                 partitions=min(filter(None, [config.spark['partitions'], target_connections - 1 if target_connections else None]), default=None),
+                                 packages=config.spark['packages'])
+        try:
+            for rows in sizer.chunked(metrics.timed('fetch', participants)):
+                with metrics.stage('spark') as span:
+                    records = spark.create_frame(rows).cache()
+                    spark.write(spark.transform(records), loader.staging_table_name)
+                    if import_devices:
+                        spark.write(spark.transform_devices(records), device_loader.staging_table_name)
+                    records.unpersist()
+                    span['rows'] = len(rows)
+                total_rows_inserted += len(rows)
+                # normalized to UTC like the pandas path, the raw API strings may carry other offsets
+                max_created_at = max(filter(None, [max_created_at, latest_created_at(row.get('created_at') for row in rows)]), default=None)
+                print(f"Insertion {counter} with chunk size of {len(rows)} rows through Spark.")
+                logging.info(f"Insertion {counter} with chunk size of {len(rows)} rows through Spark.")
+                counter += 1
+        finally:
+            spark.stop()
+    else:
+        # Fetch, transform and load run as concurrent stages, bounded queues hold back the faster stages
+        pipeline = WakoopaPipeline(maxsize=config.wakoopa['pipeline_queue_size'])
+        for chunk, changed, devices, batch in pipeline.run(sizer.chunked(metrics.timed('fetch', participants)), prepare):
+            total_rows_inserted += len(chunk)
+            # created_at is parsed to naive UTC, the watermark keeps the ISO format of the API
+            max_created_at = max(filter(None, [max_created_at, latest_created_at(chunk['created_at'])]), default=None)
+            # Insert chunk into the SQL table, changes mode only writes the new and changed participants
+            if mode == 'changes':
+                chunk = changed
+            if len(chunk) > 0:
+                with metrics.stage('insert' if mode == 'full' else 'merge') as span:
+                    if mode == 'full':
+                        write = partial(loader.insert, chunk, table_name=loader.staging_table_name)
+                    else:
+                        write = partial(loader.upsert, chunk)
+                    rows_per_sec = sizer.write(write, rows=len(chunk), bytes=int(chunk.memory_usage(deep=True).sum()), record=mode != 'changes')
+                    span['rows'] = len(chunk)
+                print(f"Insertion {counter} with chunk size of {len(chunk)} rows at {rows_per_sec:.0f} rows/sec, next batch size {sizer.size}.")
+                logging.info(f"Insertion {counter} with chunk size of {len(chunk)} rows at {rows_per_sec:.0f} rows/sec, next batch size {sizer.size}.")
+
+            if import_devices:
+                with metrics.stage('devices') as span:
+                    if mode == 'full':
+                        write = partial(device_loader.insert, devices, table_name=device_loader.staging_table_name)
+                    else:
+                        # the devices of the written participants replace their previous ones, removed devices are deleted
+                        write = partial(device_loader.upsert, devices, replace_ids=chunk['id'].tolist())
+                    sizer.write(write, rows=len(devices), record=False)
+                    span['rows'] = len(devices)
+
+            # Hashes and counts only take in the batch once it is committed, the transform thread runs ahead
+            hash_index.commit(batch)
+            save_checkpoint(batch)
+            counter += 1
+
+    if mode == 'full':
+        if total_rows_inserted == 0:
+            raise Exception('No participants returned from the API, live table left untouched, exiting')
+
+        # A pull cut short must not replace the live table, too few staged participants abort before the swap
+        with metrics.stage('swap_check'):
+            live_rows = loader.count()
+            staging_rows = loader.count(loader.staging_table_name)
+        min_rows = live_rows - int(live_rows * config.wakoopa['max_delete_share'])
+        if staging_rows < min_rows:
+            raise Exception(f"The staging table holds {staging_rows} participants against {live_rows} in {table_name}, under the "
+                            f"max_delete_share limit of {min_rows}, the pull may be truncated, live table left untouched, exiting. "
+                            f"Rerun, or raise config max_delete_share if the deletions are genuine.")
+
+        print(f'Swapping staging table in as {table_name}.')
+        logging.info(f'Swapping staging table in as {table_name}.')
+        with metrics.stage('swap'):
+            # both tables in one transaction, readers never see new participants next to old devices
+            loader.swap_staging(*([device_loader] if import_devices else []))
+
+    for name, value in hash_index.counts.items():
+        metrics.count(name, value)
+    print(f"Participants new: {hash_index.counts['new']}, updated: {hash_index.counts['updated']}, unchanged: {hash_index.counts['unchanged']}")
+    logging.info(f"Participants new: {hash_index.counts['new']}, updated: {hash_index.counts['updated']}, unchanged: {hash_index.counts['unchanged']}")
+
+    if mode == 'changes':
+        if total_rows_inserted == 0:
+            raise Exception('No participants returned from the API, nothing deleted, exiting')
+
+        # Participants missing from a full API pull were deleted upstream, unless the pull was cut short,
+        # so too many missing participants abort before anything is deleted
+        deleted_ids = hash_index.deleted_ids()
+        max_deleted = int(len(hash_index.hashes) * config.wakoopa['max_delete_share'])
+        if len(deleted_ids) > max_deleted:
+            raise Exception(f"{len(deleted_ids)} of {len(hash_index.hashes)} indexed participants are missing from the API pull, over the "
+                            f"max_delete_share limit of {max_deleted}, the pull may be truncated, nothing deleted, exiting. "
+                            f"New and changed participants were written. Rerun, or raise config max_delete_share if the deletions are genuine.")
+        with metrics.stage('delete') as span:
+            loader.delete(deleted_ids)
+            if import_devices:
+                device_loader.delete(deleted_ids, column='participant_id')
+            span['rows'] = len(deleted_ids)
+        metrics.count('deleted', len(deleted_ids))
 
     print(f"Total rows inserted: {total_rows_inserted}")
     logging.info(f"Total rows inserted: {total_rows_inserted}")
-    logging.info(f"Log file attached in the email will not be completed as the file is attached and send before the scripts completed.")
+    print(f"Run metrics: {metrics.condensed()}")
+    logging.info(f"Run metrics: {metrics.condensed()}")
 
-    # Get today's date
-    # Format the date as such example "21 March 2024" 
-    today_date = datetime.today()
-    formatted_date = today_date.strftime("%d %B %Y")
+    # Only move the watermark and the hash index once every chunk has been committed, the Spark engine
+    # does not hash, the previous index stays valid as changes mode writes whatever differs from it
+    if engine_name == 'pandas':
+        hash_index.save(replace=mode != 'incremental')
+    state.set('watermark', max_created_at)
+    state.set('checkpoint', None)
+    state.set('batch_size', sizer.best_size)
+    print(f'Batch size stored for the next run: {sizer.best_size}')
+    logging.info(f'Batch size stored for the next run: {sizer.best_size}')
+    print(f'Watermark stored: {max_created_at}')
+    logging.info(f'Watermark stored: {max_created_at}')
 
     config.email['to'] = 'xxx'
-    config.email['subject'] = f"[OK] tWakoopaParticipants Import - {formatted_date}"
-    config.email['body'] = f"The tWakoopaParticipants table was truncated and imported successfully for today.\n*This is an auto generated email, do not reply to this email."
+    config.email['subject'] = f"[OK] {table_name} Import - {formatted_date}"
+    if mode == 'full':
+        status = f"The {table_name} table was reloaded and swapped in successfully for today."
+    elif mode == 'changes':
+        status = f"{hash_index.counts['new'] + hash_index.counts['updated']} new or updated and {len(deleted_ids)} deleted participants were applied to the {table_name} table successfully for today."
+    else:
+        status = f"{total_rows_inserted} new or updated participants were merged into the {table_name} table successfully for today."
+    if args.resume:
+        status = f"Resumed interrupted run {run_id}. {status}"
+    config.email['body'] = f"{status}\n\nRun metrics: {metrics.condensed()}\n*This is an auto generated email, do not reply to this email."
     config.email['filename'] = f"{log_filename}"
     
-    s.send_email(**config.email)
-    logging.info('Email sent.')
-    print('Email sent.')
+    # Sent when s is closed at the very end, so the attached log file is complete
+    if not args.no_email:
+        s.queue_email(**config.email)
+        logging.info('Email queued.')
+        print('Email queued.')
     
-    s.update_tlog(**config.SGTAM_log_config)
-    logging.info('SGTAM log updated.')
-    print('SGTAM log updated.')  
+    config.SGTAM_log_config['logMsg'] = f"tWakoopaParticipant API Import Completed ({mode}{', resumed run ' + str(run_id) if args.resume else ''}, {total_rows_inserted} rows). {metrics.condensed()}"
+    s.queue_tlog_update(**config.SGTAM_log_config)
+    logging.info('SGTAM log update queued.')
+    print('SGTAM log update queued.')  
+    result.update(status='OK', message=status)
 
 except Exception as e:
     print(f"An error occurred: {e}")
     logging.info(f"An error occurred: {e}")
-    config.SGTAM_log_config['logMsg'] = f"An error occurred:\n{e}"
+    # Tell the operator how much work a --resume run can skip
+    checkpoint = state.get('checkpoint') if 'state' in globals() else None
+    if checkpoint is not None:
+        e = f"{e}\nBatches 1 to {checkpoint['last_batch_committed']} ({checkpoint['rows_committed']} rows) of run {checkpoint['run_id']} are committed, rerun with --resume to continue."
+        print(e)
+        logging.info(e)
+    config.SGTAM_log_config['logMsg'] = f"An error occurred:\n{e}\n{metrics.condensed()}"
     config.SGTAM_log_config['statusFlag'] = 2
     config.email['to'] = 'xxx'
-    config.email['subject'] = f"[ERROR] tWakoopaParticipants Import - {formatted_date}"
-    config.email['body'] = f"An error occurred: \n{e} \n*This is an auto generated email, do not reply to this email."
+    config.email['subject'] = f"[ERROR] {table_name} Import - {formatted_date}"
+    config.email['body'] = f"An error occurred: \n{e} \n\nRun metrics: {metrics.condensed()}\n*This is an auto generated email, do not reply to this email."
     config.email['filename'] = f"{log_filename}"
+    result['message'] = str(e)
 
-    s.send_email(**config.email)
-    logging.info('Email sent.')
-    s.update_tlog(**config.SGTAM_log_config)
-    logging.info('SGTAM log updated.')
+    if s is not None:
+        if not args.no_email:
+            s.queue_email(**config.email)
+            logging.info('Email queued.')
+        s.queue_tlog_update(**config.SGTAM_log_config)
+        logging.info('SGTAM log update queued.')
 
 
 finally:
-    print('Enter finally clause.')
-    logging.info('Enter finally clause.')
-    # Dispose the engine
-    engine.dispose()
-    print('Ensure SQL Alchemy engine is stopped and disposed.')
-    logging.info('Ensure SQL Alchemy engine is stopped and disposed.')
\ No newline at end of file
+    try:
+        print('Enter finally clause.')
+        logging.info('Enter finally clause.')
+        # Machine readable run metrics next to the log file
+        metrics.save(log_filename.replace('.txt', '_metrics.json'))
+        if args.result_file:
+            result.update(mode=globals().get('mode'), rows=globals().get('total_rows_inserted', 0), log_filename=log_filename,
+                          condensed=metrics.condensed(), metrics=metrics.summary())
+            with open(args.result_file, 'w') as f:
+                json.dump(result, f, indent=4, default=str)
+        # Close the API connections and dispose the engines
+        if wakoopa is not None:
+            wakoopa.close()
+        if engine is not None:
+            engine.dispose()
+        print('Ensure SQL Alchemy engine is stopped and disposed.')
+        logging.info('Ensure SQL Alchemy engine is stopped and disposed.')
+    finally:
+        # Last and whatever failed above, waits for the queued tLog update and sends the email with the complete log file
+        if s is not None:
+            s.close()
\ No newline at end of file
@@ -0,0 +1,5 @@
+pushd "D:\SGTAM_DP\Working Project\Wakoopa\tWakoopaParticipantImport"
+
+python tWakoopaParticipantRunner.py
+
+TIMEOUT 3
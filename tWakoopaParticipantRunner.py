@@ -0,0 +1,122 @@
+import logging
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from SGTAMProdTask import SGTAMProd
+from WakoopaMetrics import WakoopaMetrics
+import config
+
+parser = argparse.ArgumentParser(description='Import several Wakoopa panels in parallel, one tWakoopaParticipant.py process per client of config wakoopa_clients.')
+parser.add_argument('--clients', nargs='+', default=None, help='names of the clients to import, default is every client of config wakoopa_clients')
+parser.add_argument('--max-concurrency', type=int, default=config.runner['max_concurrency'], help='clients imported at the same time')
+parser.add_argument('--db-connections', type=int, default=config.runner['db_connections'],
+                    help='database connections shared by all running clients, split evenly, at least 2 per client, 3 with the Spark engine')
+parser.add_argument('--mode', choices=['full', 'incremental', 'changes'], default=None, help='passed on to every client, see tWakoopaParticipant.py')
+parser.add_argument('--engine', choices=['pandas', 'spark'], default=None, help='passed on to every client, see tWakoopaParticipant.py')
+parser.add_argument('--replay', action='store_true', help='passed on to every client, see tWakoopaParticipant.py')
+args = parser.parse_args()
+# A Spark client also holds the connection of its JDBC driver next to one per write partition
+min_connections = 3 if (args.engine or config.wakoopa['engine']) == 'spark' else 2
+if args.db_connections < min_connections:
+    parser.error(f'--db-connections must be at least {min_connections}, one for the SGTAM log and the rest for the target database of a client')
+metrics = WakoopaMetrics()
+formatted_date = datetime.today().strftime("%d %B %Y")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+s = None
+
+try:
+    # Set up logging
+    log_filename = f"D:/SGTAM_DP/Working Project/Wakoopa/tWakoopaParticipantImport/log/tWakoopaParticipantRunner_{datetime.now().strftime('%Y-%m-%d %H-%M-%S')}.txt"
+    logging.basicConfig(filename=log_filename, level=logging.INFO)
+    s = SGTAMProd(pool_size=1, max_overflow=0)
+
+    clients = [client['name'] for client in config.wakoopa_clients if args.clients is None or client['name'] in args.clients]
+    unknown = set(args.clients or []) - set(clients)
+    if unknown:
+        raise Exception(f"Unknown clients {', '.join(sorted(unknown))}, see config wakoopa_clients, exiting")
+
+    # The connection budget is a hard cap, fewer clients run at once when it cannot give each one enough connections
+    concurrency = max(1, min(args.max_concurrency, len(clients), args.db_connections // min_connections))
+    connections = args.db_connections // concurrency
+    print(f'Importing {len(clients)} clients, {concurrency} at a time with {connections} database connections each.')
+    logging.info(f'Importing {len(clients)} clients, {concurrency} at a time with {connections} database connections each.')
+
+    result_dir = tempfile.mkdtemp(prefix='tWakoopaParticipantRunner_')
+    passthrough = []
+    if args.mode:
+        passthrough += ['--mode', args.mode]
+    if args.engine:
+        passthrough += ['--engine', args.engine]
+    if args.replay:
+        passthrough.append('--replay')
+
+    def run_client(name):
+        # Every client is its own process, with its own tLog entry, log file, state and metrics
+        result_file = os.path.join(result_dir, f'{name}.json')
+        command = [sys.executable, os.path.join(ROOT, 'tWakoopaParticipant.py'), '--client', name, '--no-email',
+                   '--db-connections', str(connections), '--result-file', result_file] + passthrough
+        logging.info(f"Starting client {name}: {' '.join(command)}")
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+
+        try:
+            with open(result_file, 'r') as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            result = {'client' : name, 'status' : 'ERROR', 'mode' : None, 'rows' : 0, 'condensed' : '',
+                      'message' : f'Exited with code {completed.returncode} without a result: {completed.stderr.strip()[-1000:]}'}
+
+        metrics.add(name, seconds=seconds, rows=result['rows'] or 0)
+        print(f"Client {name} {result['status']} in {seconds:.1f}s.")
+        logging.info(f"Client {name} {result['status']} in {seconds:.1f}s: {result['message']}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run_client, clients))
+
+    failed = [result['client'] for result in results if result['status'] != 'OK']
+    lines = [f"{result['client']} [{result['status']}] {result['mode'] or ''} {result['rows']} rows: {result['message']}\n    {result.get('condensed', '')}"
+             for result in results]
+    print(f"Run metrics: {metrics.condensed()}")
+    logging.info(f"Run metrics: {metrics.condensed()}")
+
+    config.email['to'] = 'xxx'
+    config.email['subject'] = f"[{'ERROR' if failed else 'OK'}] tWakoopaParticipants Import, {len(clients)} clients - {formatted_date}"
+    config.email['body'] = ("\n\n".join(lines) +
+                            f"\n\nRun metrics: {metrics.condensed()}\nEach client has its own log file and tLog entry.\n*This is an auto generated email, do not reply to this email.")
+    config.email['filename'] = f"{log_filename}"
+
+    # Sent when s is closed at the very end, so the attached log file is complete
+    s.queue_email(**config.email)
+    logging.info('Email queued.')
+    print('Email queued.')
+
+except Exception as e:
+    print(f"An error occurred: {e}")
+    logging.info(f"An error occurred: {e}")
+    config.email['to'] = 'xxx'
+    config.email['subject'] = f"[ERROR] tWakoopaParticipants Import Runner - {formatted_date}"
+    config.email['body'] = f"An error occurred: \n{e} \n\nRun metrics: {metrics.condensed()}\n*This is an auto generated email, do not reply to this email."
+    config.email['filename'] = f"{log_filename}"
+
+    if s is not None:
+        s.queue_email(**config.email)
+        logging.info('Email queued.')
+
+
+finally:
+    try:
+        print('Enter finally clause.')
+        logging.info('Enter finally clause.')
+        metrics.save(log_filename.replace('.txt', '_metrics.json'))
+    finally:
+        # Last and whatever failed above, sends the email with the complete log file
+        if s is not None:
+            s.close()
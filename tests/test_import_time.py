@@ -0,0 +1,13 @@
+from bench_import_time import BUDGET_MS, ENTRY_POINT_MODULES, HEAVY_MODULES, import_time
+
+
+def test_entry_point_imports_no_heavy_modules():
+    cumulative = import_time(ENTRY_POINT_MODULES)
+    assert [module for module in HEAVY_MODULES if module in cumulative] == []
+
+
+def test_entry_point_import_time_within_budget():
+    # best of 3 fresh interpreters, a single cold start is noisy
+    total_ms = min(sum(run.get(module, 0) for module in ENTRY_POINT_MODULES) / 1000
+                   for run in (import_time(ENTRY_POINT_MODULES) for m in range(3)))
+    assert total_ms <= BUDGET_MS, f'cold-start import time {total_ms:.1f} ms exceeds budget of {BUDGET_MS:.1f} ms'
@@ -0,0 +1,186 @@
+import pytest
+
+import SGTAMProdTask
+import SGTAMProdTaskConfig
+from SGTAMProdTask import SGTAMProd
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(SGTAMProdTask.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def holiday_cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(SGTAMProdTaskConfig.holiday_cache, 'filename', str(tmp_path / 'holidays.json'))
+    monkeypatch.setitem(SGTAMProdTaskConfig.holiday_cache, 'ttl', 100)
+
+
+def sgtamprod(queries):
+    """SGTAMProd whose holiday query answers every date as a holiday and records the dates asked for"""
+
+    s = SGTAMProd()
+
+    def execute_query_with_result(sql_query, database):
+        dates = [value.strip("()' ") for value in sql_query.split('VALUES')[1].split('AS d')[0].split(',')]
+        queries.append(dates)
+        return [(ref_date, 1) for ref_date in dates]
+
+    s.execute_query_with_result = execute_query_with_result
+    return s
+
+
+def test_holidays_are_resolved_once_per_date(holiday_cache, clock):
+    queries = []
+    s = sgtamprod(queries)
+    s.prefetch_holidays('2024-01-01', '2024-01-03', include_weekend=1)
+    assert s.is_holiday('2024-01-02', include_weekend=1)
+    assert s.get_holidays(['2024-01-03', '2024-01-04'], include_weekend=1) == {'2024-01-03' : True, '2024-01-04' : True}
+    assert queries == [['2024-01-01', '2024-01-02', '2024-01-03'], ['2024-01-04']]
+
+
+def test_holiday_entries_expire_one_by_one(holiday_cache, clock):
+    queries = []
+    sgtamprod(queries).is_holiday('2024-01-01', include_weekend=1)
+    clock[0] += 90
+    # saving a later date keeps the fetch time of the earlier one
+    sgtamprod(queries).is_holiday('2024-01-02', include_weekend=1)
+    clock[0] += 90
+
+    s = sgtamprod(queries)
+    s.get_holidays(['2024-01-01', '2024-01-02'], include_weekend=1)
+    assert queries == [['2024-01-01'], ['2024-01-02'], ['2024-01-01']]
+    clock[0] += 20
+    s.get_holidays(['2024-01-01', '2024-01-02'], include_weekend=1)
+    assert queries[-1] == ['2024-01-02']
+
+
+def test_chunks_are_fetched_from_the_cursor_and_the_connection_returned(tmp_path):
+    sql = pytest.importorskip('sqlalchemy')
+    pytest.importorskip('pandas')
+
+    engine = sql.create_engine(f"sqlite:///{tmp_path / 'tlog.db'}", poolclass=sql.pool.QueuePool)
+    with engine.begin() as con:
+        con.execute('CREATE TABLE tLog (logID INTEGER, statusFlag INTEGER)')
+        con.execute(sql.text('INSERT INTO tLog VALUES (:logID, :statusFlag)'), [{'logID' : i, 'statusFlag' : i % 3} for i in range(25)])
+    s = SGTAMProd()
+    s.engines['test'] = engine
+
+    chunks = list(s.execute_query_to_df_chunks('SELECT logID, statusFlag FROM tLog ORDER BY logID', 'test', chunksize=10, dtype={'statusFlag' : 'int8'}))
+    assert [len(df) for df in chunks] == [10, 10, 5]
+    assert list(chunks[0].columns) == ['logID', 'statusFlag'] and chunks[0]['statusFlag'].dtype == 'int8'
+
+    rows = s.execute_query_to_df_chunks('SELECT logID FROM tLog ORDER BY logID', 'test', chunksize=10, as_rows=True)
+    assert [row[0] for row in next(rows)] == list(range(10))
+    rows.close()
+    assert engine.pool.checkedout() == 0
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP, every connection opened is kept in connections"""
+
+    connections = []
+
+    def __init__(self, host, port, timeout=None):
+        self.messages = []
+        self.alive = True
+        self.closed = False
+        FakeSMTP.connections.append(self)
+
+    def noop(self):
+        if not self.alive:
+            raise OSError('connection dropped')
+        return 250, b'OK'
+
+    def send_message(self, message):
+        self.messages.append(message)
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    import smtplib
+    FakeSMTP.connections = []
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    return FakeSMTP.connections
+
+
+def email(subject, **kwargs):
+    return dict({'to' : 'ops@example.com', 'subject' : subject, 'body' : 'body', 'is_html' : False}, **kwargs)
+
+
+def test_queued_notifications_run_in_order_and_emails_wait_for_close(smtp):
+    s = SGTAMProd()
+    statements = []
+    s.execute_query_without_result = lambda sql_query, database: statements.append(sql_query)
+
+    log_config = {'logTaskID' : 124, 'statusFlag' : 1, 'logMsg' : 'started', 'logID' : 'abc'}
+    s.queue_tlog_update(**log_config)
+    # the queued update keeps its own copy
+    log_config['logMsg'] = 'changed afterwards'
+    s.queue_email(**email('first'))
+    s.queue_email(**email('second'))
+    s.queue_tlog_update(**dict(log_config, logMsg="it's done"))
+    assert smtp == []
+
+    s.close()
+    assert len(statements) == 2
+    assert "'started'" in statements[0] and "'it''s done'" in statements[1]
+    assert len(smtp) == 1 and smtp[0].closed
+    assert [message['Subject'] for message in smtp[0].messages] == ['first', 'second']
+    assert s.notification_errors == []
+
+
+def test_a_failed_notification_does_not_stop_the_others(smtp):
+    s = SGTAMProd()
+
+    def execute_query_without_result(sql_query, database):
+        # the database errors of update_tlog end in sys.exit
+        raise SystemExit('database down')
+
+    s.execute_query_without_result = execute_query_without_result
+    s.queue_tlog_update(logTaskID=124, statusFlag=2, logMsg='failed', logID='abc')
+    s.queue_email(**email('error'))
+    errors = s.flush()
+    assert errors == ['tLog update: database down']
+    assert [message['Subject'] for message in smtp[0].messages] == ['error']
+    s.close()
+
+
+def test_a_dropped_smtp_connection_is_reopened(smtp):
+    s = SGTAMProd()
+    s.send_email(**email('first'))
+    smtp[0].alive = False
+    s.send_email(**email('second'))
+    assert len(smtp) == 2 and smtp[0].closed
+    assert [message['Subject'] for message in smtp[1].messages] == ['second']
+    s.close()
+
+
+def test_large_attachments_are_sent_gzip_compressed(smtp, tmp_path, monkeypatch):
+    import gzip
+
+    monkeypatch.setattr(SGTAMProdTaskConfig, 'attachment_gzip_bytes', 1000)
+    small = tmp_path / 'small.txt'
+    small.write_bytes(b'x' * 999)
+    large = tmp_path / 'large.txt'
+    large.write_bytes(b'log line\n' * 1000)
+
+    s = SGTAMProd()
+    s.send_email(**email('small', filename=str(small)))
+    s.send_email(**email('large', filename=str(large)))
+    s.close()
+
+    small_part, large_part = [message.get_payload()[1] for message in smtp[0].messages]
+    assert small_part.get_filename() == 'small.txt'
+    assert small_part.get_payload(decode=True) == b'x' * 999
+    assert large_part.get_filename() == 'large.txt.gz'
+    assert large_part.get_content_type() == 'application/gzip'
+    assert gzip.decompress(large_part.get_payload(decode=True)) == b'log line\n' * 1000
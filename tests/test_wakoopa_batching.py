@@ -0,0 +1,66 @@
+import pytest
+
+from WakoopaBatching import WakoopaBatchSizer
+
+
+def test_record_climbs_while_throughput_improves():
+    sizer = WakoopaBatchSizer(size=10000, max_size=100000)
+    assert sizer.record(10000, 1.0) == 15000
+    assert sizer.record(15000, 1.2) == 22500
+
+
+def test_record_turns_around_on_throughput_drop():
+    sizer = WakoopaBatchSizer(size=10000, max_size=100000)
+    sizer.record(10000, 1.0)
+    # 15000 rows at 5000 rows/sec is well below 10000 rows/sec
+    assert sizer.record(15000, 3.0) == 10000
+    assert sizer.best_size == 10000
+
+
+def test_record_shrinks_past_latency_and_memory_limits():
+    sizer = WakoopaBatchSizer(size=10000, max_seconds=10, max_bytes=100 * 2**20)
+    assert sizer.record(10000, 20.0) == 5000
+    assert sizer.record(5000, 1.0, bytes=200 * 2**20) == 2500
+
+
+def test_record_stays_within_bounds():
+    sizer = WakoopaBatchSizer(size=90000, min_size=1000, max_size=100000)
+    assert sizer.record(90000, 1.0) == 100000
+    sizer = WakoopaBatchSizer(size=1500, min_size=1000, max_seconds=1)
+    assert sizer.record(1500, 100.0) == 1000
+
+
+def test_write_retries_deadlocks_and_halves_the_size():
+    sizer = WakoopaBatchSizer(size=10000, backoff=0)
+    attempts = []
+
+    def write():
+        attempts.append(sizer.size)
+        if len(attempts) < 3:
+            raise Exception('Transaction was deadlocked on lock resources (1205)')
+        return 'done'
+
+    assert sizer.write(write, rows=10000, record=False) == 'done'
+    assert attempts == [10000, 5000, 2500]
+
+
+def test_write_raises_other_errors_at_once():
+    sizer = WakoopaBatchSizer(size=10000, backoff=0)
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        raise ValueError('invalid column name')
+
+    with pytest.raises(ValueError):
+        sizer.write(write, rows=10000)
+    assert len(attempts) == 1
+
+
+def test_chunked_reads_the_size_before_every_batch():
+    sizer = WakoopaBatchSizer(size=1000, min_size=1)
+    sizes = []
+    for chunk in sizer.chunked(range(3500)):
+        sizes.append(len(chunk))
+        sizer.size = 500
+    assert sizes == [1000, 500, 500, 500, 500, 500]
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from WakoopaCache import WakoopaCache
+
+
+def cache_page(cache, key, data):
+    writer = cache.write(key, [data[i:i + 5] for i in range(0, len(data), 5)])
+    assert b''.join(writer) == data
+    writer.commit()
+
+
+def age(cache, key, seconds):
+    filename = os.path.join(cache.directory, f'{key}.json.gz')
+    stat = os.stat(filename)
+    os.utime(filename, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+def test_key_ignores_signing_params():
+    cache = WakoopaCache('unused')
+    assert cache.key('participants', {'page' : 1, 'nonce' : 'a', 'timestamp' : 1, 'signature' : 'x'}) == \
+           cache.key('participants', {'page' : 1, 'nonce' : 'b', 'timestamp' : 2, 'signature' : 'y'})
+    assert cache.key('participants', {'page' : 1}) != cache.key('participants', {'page' : 2})
+
+
+def test_round_trip(tmp_path):
+    cache = WakoopaCache(str(tmp_path))
+    data = json.dumps({'participants' : list(range(100))}).encode('utf-8')
+    cache_page(cache, 'k', data)
+    assert b''.join(cache.read('k')) == data
+    assert cache.read('missing') is None
+
+
+def test_ttl_counts_from_fetch_not_last_read(tmp_path):
+    cache = WakoopaCache(str(tmp_path), ttl=100)
+    cache_page(cache, 'k', b'{}')
+    age(cache, 'k', 60)
+    assert cache.read('k') is not None
+    age(cache, 'k', 60)
+    # read 60s ago, fetched 120s ago
+    assert cache.read('k') is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_discarded_response_is_not_cached(tmp_path):
+    cache = WakoopaCache(str(tmp_path))
+    writer = cache.write('k', [b'{"participants": [', b'{"id": 1}'])
+    with pytest.raises(ValueError):
+        json.loads(b''.join(writer))
+    writer.discard()
+    assert cache.read('k') is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_partly_read_response_cannot_be_committed(tmp_path):
+    cache = WakoopaCache(str(tmp_path))
+    writer = cache.write('k', [b'a', b'b', b'c'])
+    next(iter(writer))
+    with pytest.raises(Exception, match='not read to the end'):
+        writer.commit()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_evicts_least_recently_read_past_max_bytes(tmp_path):
+    cache = WakoopaCache(str(tmp_path), max_bytes=10**6)
+    for key in ['a', 'b', 'c']:
+        cache_page(cache, key, os.urandom(1000))
+    for key, seconds in [('a', 30), ('b', 20), ('c', 10)]:
+        age(cache, key, seconds)
+    cache.read('a')
+
+    size = os.path.getsize(os.path.join(str(tmp_path), 'a.json.gz'))
+    cache.max_bytes = 2 * size + 100
+    cache.evict()
+    assert sorted(os.listdir(str(tmp_path))) == ['a.json.gz', 'c.json.gz']
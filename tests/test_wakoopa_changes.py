@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from WakoopaChanges import WakoopaHashIndex
+from WakoopaTransform import transform
+
+
+def participants(ids, time_zone='Singapore'):
+    return [{'id' : i, 'tags' : ['a'], 'time_zone' : time_zone, 'created_at' : '2023-01-01T00:00:00Z', 'profile_url' : f'url{i}'} for i in ids]
+
+
+def run(filename, batches):
+    index = WakoopaHashIndex(filename)
+    changed_ids = []
+    for batch in batches:
+        changed, hashed = index.diff(transform(batch))
+        index.commit(hashed)
+        changed_ids += changed['id'].tolist()
+    return index, changed_ids
+
+
+def test_first_run_writes_everything(tmp_path):
+    index, changed_ids = run(str(tmp_path / 'hashes.pkl.gz'), [participants(range(3))])
+    assert changed_ids == [0, 1, 2]
+    assert index.counts == {'new' : 3, 'updated' : 0, 'unchanged' : 0}
+    assert index.deleted_ids() == []
+
+
+def test_diff_against_saved_index(tmp_path):
+    filename = str(tmp_path / 'hashes.pkl.gz')
+    index, changed_ids = run(filename, [participants(range(4))])
+    index.save()
+
+    batch = participants([0, 1]) + participants([2], time_zone='Tokyo') + participants([5])
+    index, changed_ids = run(filename, [batch])
+    assert changed_ids == [2, 5]
+    assert index.counts == {'new' : 1, 'updated' : 1, 'unchanged' : 2}
+    assert index.deleted_ids() == [3]
+
+
+def test_incremental_save_merges_into_index(tmp_path):
+    filename = str(tmp_path / 'hashes.pkl.gz')
+    index, changed_ids = run(filename, [participants(range(3))])
+    index.save()
+    index, changed_ids = run(filename, [participants([3])])
+    index.save(replace=False)
+    assert sorted(pd.read_pickle(filename).index) == [0, 1, 2, 3]
+
+
+def test_diff_keeps_nothing_until_commit(tmp_path):
+    index = WakoopaHashIndex(str(tmp_path / 'hashes.pkl.gz'))
+    index.diff(transform(participants(range(3))))
+    assert index.seen == []
+    assert index.counts == {'new' : 0, 'updated' : 0, 'unchanged' : 0}
+
+
+def test_progress_resumes_committed_batches_only(tmp_path):
+    filename = str(tmp_path / 'hashes.pkl.gz')
+    index = WakoopaHashIndex(filename)
+    for number, ids in enumerate([range(0, 2), range(2, 4), range(4, 6)], 1):
+        changed, batch = index.diff(transform(participants(ids)))
+        index.commit(batch)
+        index.save_progress(number, batch)
+
+    resumed = WakoopaHashIndex(filename)
+    resumed.load_progress(2)
+    assert resumed.counts == {'new' : 4, 'updated' : 0, 'unchanged' : 0}
+    assert sorted(os.listdir(resumed.progress_dir)) == ['00000001.pkl.gz', '00000002.pkl.gz']
+
+    resumed.save()
+    assert not os.path.exists(resumed.progress_dir)
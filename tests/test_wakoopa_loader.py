@@ -0,0 +1,194 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from WakoopaLoader import WakoopaLoader, DEVICE_COLUMNS, DEVICE_SQL_TYPES
+
+
+class FakeEngine:
+    """Records the SQL a WakoopaLoader sends, every statement as (transaction, sql, parameter rows)"""
+
+    def __init__(self, scalar=None):
+        self.statements = []
+        self.transactions = 0
+        self.scalar = scalar
+
+    def begin(self):
+        self.transactions += 1
+        return FakeConnection(self)
+
+    connect = begin
+
+    def raw_connection(self):
+        self.transactions += 1
+        return FakeConnection(self)
+
+    def sql(self):
+        return [sql for transaction, sql, rows in self.statements]
+
+
+class FakeConnection:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.committed = exc[0] is None
+
+    def execute(self, sql):
+        self.engine.statements.append((self.engine.transactions, sql, None))
+        return self
+
+    def executemany(self, sql, rows):
+        self.engine.statements.append((self.engine.transactions, sql, rows))
+
+    def scalar(self):
+        return self.engine.scalar
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def participants(ids):
+    return pd.DataFrame({'import_date' : '2024-01-01', 'id' : ids, 'tags' : 'a|b', 'time_zone' : 'Singapore',
+                         'created_at' : pd.to_datetime('2023-01-01'), 'profile_url' : [f'url{i}' for i in ids]})
+
+
+def test_upsert_loads_the_delta_table_and_merges_on_the_key():
+    engine = FakeEngine()
+    WakoopaLoader(engine=engine, table_name='tWakoopaParticipants').upsert(participants([1, 2]))
+
+    sql = engine.sql()
+    assert sql[0].startswith("IF OBJECT_ID('tWakoopaParticipants_delta', 'U') IS NULL SELECT TOP 0")
+    assert sql[1] == 'TRUNCATE TABLE tWakoopaParticipants_delta'
+    assert sql[2].startswith('INSERT INTO tWakoopaParticipants_delta (import_date, id, tags, time_zone, created_at, profile_url)')
+    assert [row[1] for row in engine.statements[2][2]] == [1, 2]
+    assert sql[3].startswith('MERGE tWakoopaParticipants WITH (HOLDLOCK) AS t USING tWakoopaParticipants_delta AS s ON t.id = s.id')
+    assert 'UPDATE SET t.import_date = s.import_date, t.tags = s.tags' in sql[3]
+    # the delta load and the MERGE commit together
+    assert len({transaction for transaction, sql, rows in engine.statements}) == 1
+
+
+def test_upsert_of_nothing_sends_nothing():
+    engine = FakeEngine()
+    WakoopaLoader(engine=engine, table_name='tWakoopaParticipants').upsert(participants([]))
+    assert engine.statements == []
+
+
+def test_insert_binds_every_row_in_one_batch():
+    engine = FakeEngine()
+    loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipants')
+    df = participants([1, 2, 3])
+    df.loc[1, 'created_at'] = pd.NaT
+    loader.insert(df)
+    loader.insert(df, table_name=loader.staging_table_name)
+
+    (_, sql, rows), (_, staging_sql, _) = engine.statements
+    assert sql == 'INSERT INTO tWakoopaParticipants (import_date, id, tags, time_zone, created_at, profile_url) VALUES (?, ?, ?, ?, ?, ?)'
+    assert [row[1] for row in rows] == [1, 2, 3]
+    assert rows[1][4] is None and rows[0][4].year == 2023
+    # only the staging table nobody reads is locked for a minimally logged insert
+    assert staging_sql.startswith('INSERT INTO tWakoopaParticipants_staging WITH (TABLOCK) (')
+
+
+def test_swap_renames_every_table_in_one_transaction():
+    engine = FakeEngine()
+    loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipants')
+    device_loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipantDevices', key='device_id', parent_key='participant_id')
+    loader.swap_staging(device_loader)
+
+    indexes = [(transaction, sql) for transaction, sql, rows in engine.statements if sql.startswith('CREATE')]
+    renames = [(transaction, sql) for transaction, sql, rows in engine.statements if not sql.startswith('CREATE')]
+    assert [sql for transaction, sql in indexes] == [
+        'CREATE CLUSTERED INDEX IX_tWakoopaParticipants_id ON tWakoopaParticipants_staging (id)',
+        'CREATE CLUSTERED INDEX IX_tWakoopaParticipantDevices_device_id ON tWakoopaParticipantDevices_staging (device_id)',
+        'CREATE INDEX IX_tWakoopaParticipantDevices_participant_id ON tWakoopaParticipantDevices_staging (participant_id)',
+    ]
+    assert [sql for transaction, sql in renames] == [
+        "IF OBJECT_ID('tWakoopaParticipants_old', 'U') IS NOT NULL DROP TABLE tWakoopaParticipants_old",
+        "EXEC sp_rename 'tWakoopaParticipants', 'tWakoopaParticipants_old'",
+        "EXEC sp_rename 'tWakoopaParticipants_staging', 'tWakoopaParticipants'",
+        "IF OBJECT_ID('tWakoopaParticipantDevices_old', 'U') IS NOT NULL DROP TABLE tWakoopaParticipantDevices_old",
+        "EXEC sp_rename 'tWakoopaParticipantDevices', 'tWakoopaParticipantDevices_old'",
+        "EXEC sp_rename 'tWakoopaParticipantDevices_staging', 'tWakoopaParticipantDevices'",
+    ]
+    assert len({transaction for transaction, sql in renames}) == 1
+    assert max(transaction for transaction, sql in indexes) < renames[0][0]
+
+
+def test_restore_previous_exchanges_the_tables():
+    engine = FakeEngine()
+    WakoopaLoader(engine=engine, table_name='tWakoopaParticipants').restore_previous()
+    assert engine.sql() == ["EXEC sp_rename 'tWakoopaParticipants', 'tWakoopaParticipants_swap'",
+                            "EXEC sp_rename 'tWakoopaParticipants_old', 'tWakoopaParticipants'",
+                            "EXEC sp_rename 'tWakoopaParticipants_swap', 'tWakoopaParticipants_old'"]
+
+
+
+def test_count():
+    engine = FakeEngine(scalar=42)
+    loader = WakoopaLoader(engine=engine, table_name='tWakoopaParticipants')
+    assert loader.count(loader.staging_table_name) == 42
+    assert engine.sql() == ['SELECT COUNT_BIG(*) FROM tWakoopaParticipants_staging']
+
+
+def devices(rows):
+    return pd.DataFrame([{'import_date' : '2024-01-01', 'participant_id' : p, 'device_id' : d, 'platform' : 'android',
+                          'created_at' : pd.to_datetime('2023-01-01')} for p, d in rows], columns=DEVICE_COLUMNS)
+
+
+def device_loader(engine):
+    return WakoopaLoader(engine=engine, table_name='tWakoopaParticipantDevices', key='device_id', columns=DEVICE_COLUMNS,
+                         parent_key='participant_id', sql_types=DEVICE_SQL_TYPES)
+
+
+def test_upsert_replaces_the_rows_of_replace_ids_in_the_same_transaction():
+    engine = FakeEngine()
+    device_loader(engine).upsert(devices([(1, 10), (1, 11)]), replace_ids=[1, 2])
+
+    transaction, sql, rows = engine.statements[0]
+    assert sql == 'DELETE FROM tWakoopaParticipantDevices WHERE participant_id = ?'
+    assert rows == [[1], [2]]
+    assert engine.sql()[-1].startswith('MERGE tWakoopaParticipantDevices WITH (HOLDLOCK) AS t USING tWakoopaParticipantDevices_delta AS s '
+                                       'ON t.device_id = s.device_id')
+    assert len({transaction for transaction, sql, rows in engine.statements}) == 1
+
+
+def test_upsert_without_rows_still_removes_the_rows_of_replace_ids():
+    engine = FakeEngine()
+    device_loader(engine).upsert(devices([]), replace_ids=[3])
+    assert engine.sql() == ['DELETE FROM tWakoopaParticipantDevices WHERE participant_id = ?']
+
+
+def test_upsert_replace_ids_needs_a_parent_key():
+    with pytest.raises(Exception, match='No parent_key'):
+        WakoopaLoader(engine=FakeEngine(), table_name='tWakoopaParticipants').upsert(participants([1]), replace_ids=[1])
+
+
+def test_create_table_only_when_missing():
+    engine = FakeEngine(scalar=None)
+    device_loader(engine).create_table()
+    assert engine.sql() == [
+        "SELECT OBJECT_ID('tWakoopaParticipantDevices', 'U')",
+        'CREATE TABLE tWakoopaParticipantDevices (import_date DATE, participant_id BIGINT NOT NULL, device_id BIGINT NOT NULL, '
+        'platform NVARCHAR(100), created_at DATETIME2)',
+        'CREATE CLUSTERED INDEX IX_tWakoopaParticipantDevices_device_id ON tWakoopaParticipantDevices (device_id)',
+        'CREATE INDEX IX_tWakoopaParticipantDevices_participant_id ON tWakoopaParticipantDevices (participant_id)',
+    ]
+
+    engine = FakeEngine(scalar=12345)
+    device_loader(engine).create_table()
+    assert engine.sql() == ["SELECT OBJECT_ID('tWakoopaParticipantDevices', 'U')"]
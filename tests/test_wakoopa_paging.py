@@ -0,0 +1,104 @@
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+pytest.importorskip('requests')
+
+from WakoopaTask import Wakoopa
+
+
+@contextmanager
+def stub_api(respond):
+    """Local /api/v1/participants/ stand-in, respond(page, per_page) returns status, headers and participants"""
+
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            page, per_page = int(query['page'][0]), int(query['per_page'][0])
+            requested.append(page)
+            status, headers, participants = respond(page, per_page)
+            body = json.dumps({'participants' : participants}).encode('utf-8')
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}/api/v1', requested
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def panel(size, cap=None):
+    def respond(page, per_page):
+        per_page = min(per_page, cap or per_page)
+        return 200, {}, [{'id' : i} for i in range((page - 1) * per_page, min(size, page * per_page))]
+    return respond
+
+
+def participant_ids(base_url, **kwargs):
+    wakoopa = Wakoopa(client='test', secret='test', base_url=base_url)
+    try:
+        return [p['id'] for p in wakoopa.get_participants(date_from='2023-03-31', include=None, **kwargs)]
+    finally:
+        wakoopa.close()
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_paging_stops_at_the_first_empty_page(max_workers):
+    with stub_api(panel(25)) as (base_url, requested):
+        assert participant_ids(base_url, per_page=10, max_workers=max_workers) == list(range(25))
+    assert {1, 2, 3, 4} <= set(requested)
+
+
+def test_short_pages_of_a_capped_api_do_not_end_the_pull():
+    with stub_api(panel(25, cap=4)) as (base_url, requested):
+        assert participant_ids(base_url, per_page=10) == list(range(25))
+
+
+def test_resume_refuses_a_capped_api():
+    with stub_api(panel(25, cap=4)) as (base_url, requested):
+        with pytest.raises(Exception, match='caps the page size'):
+            participant_ids(base_url, per_page=10, skip=10)
+
+
+def test_rate_limit_halves_the_workers_and_keeps_page_order():
+    throttled = []
+
+    def respond(page, per_page):
+        if page == 3 and not throttled:
+            throttled.append(page)
+            return 429, {'Retry-After' : '0.2'}, []
+        return panel(100)(page, per_page)
+
+    with stub_api(respond) as (base_url, requested):
+        assert participant_ids(base_url, per_page=10, max_workers=4) == list(range(100))
+    # pages 1 and 2 are kept, the throttled window is refetched from page 3 with 2 workers, then 3
+    assert set(requested[:4]) == {1, 2, 3, 4}
+    assert set(requested[4:6]) == {3, 4}
+    assert set(requested[6:9]) == {5, 6, 7}
+
+
+def test_rate_limit_gives_up_after_rate_limit_retries():
+    with stub_api(lambda page, per_page: (429, {'Retry-After' : '0'}, [])) as (base_url, requested):
+        wakoopa = Wakoopa(client='test', secret='test', base_url=base_url, rate_limit_retries=3)
+        with pytest.raises(Exception, match='4 times in a row'):
+            list(wakoopa.get_participants(date_from='2023-03-31', include=None, max_workers=2))
+        wakoopa.close()
+    assert len(requested) >= 4
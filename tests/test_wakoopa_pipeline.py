@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from WakoopaPipeline import WakoopaPipeline
+
+
+def test_run_keeps_source_order_through_stages():
+    pipeline = WakoopaPipeline(maxsize=1)
+    assert list(pipeline.run(range(50), lambda x: x * 2, lambda x: x + 1)) == [x * 2 + 1 for x in range(50)]
+
+
+def test_run_raises_the_first_stage_error():
+    def stage(x):
+        if x == 3:
+            raise ValueError('bad batch')
+        return x
+
+    with pytest.raises(ValueError, match='bad batch'):
+        list(WakoopaPipeline().run(range(10), stage))
+
+
+def test_run_raises_source_errors():
+    def source():
+        yield 1
+        raise IOError('API down')
+
+    with pytest.raises(IOError, match='API down'):
+        list(WakoopaPipeline().run(source(), lambda x: x))
+
+
+def test_consumer_stopping_early_stops_the_stages():
+    pulled = []
+
+    def source():
+        for x in range(1000):
+            pulled.append(x)
+            yield x
+
+    for x in WakoopaPipeline(maxsize=1).run(source(), lambda x: x):
+        if x == 2:
+            break
+    # only what fits in the bounded queues was read ahead
+    assert len(pulled) < 10
+    assert [thread for thread in threading.enumerate() if thread.name.startswith('pipeline-')] == []
+
+
+def test_stages_overlap():
+    def slow(x):
+        time.sleep(0.05)
+        return x
+
+    start = time.perf_counter()
+    list(WakoopaPipeline().run((slow(x) for x in range(10)), slow))
+    # sequential would take 1s, fetch and stage overlap to about half of it
+    assert time.perf_counter() - start < 0.9
+
+
+def test_pipeline_runs_again_after_a_run():
+    pipeline = WakoopaPipeline()
+    assert list(pipeline.run(range(3), lambda x: x)) == [0, 1, 2]
+    assert list(pipeline.run(range(3), lambda x: x + 1)) == [1, 2, 3]
+
+    def stage(x):
+        raise ValueError('bad batch')
+
+    with pytest.raises(ValueError):
+        list(pipeline.run(range(3), stage))
+    assert list(pipeline.run(range(2), lambda x: x)) == [0, 1]
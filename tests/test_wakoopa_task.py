@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from WakoopaTask import iter_json_array, parse_retry_after
+
+
+def split(document, size):
+    data = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 65536])
+def test_iter_json_array_any_chunk_size(size):
+    document = {'meta' : {'participants' : 'not this one'}, 'participants' : [{'id' : i, 'tags' : ['ä', '日本']} for i in range(20)]}
+    assert list(iter_json_array(split(document, size), 'participants')) == document['participants']
+
+
+def test_iter_json_array_empty_array():
+    assert list(iter_json_array(split({'participants' : []}, 4), 'participants')) == []
+
+
+def test_iter_json_array_missing_key():
+    assert list(iter_json_array(split({'other' : [1, 2]}, 4), 'participants')) == []
+
+
+def test_iter_json_array_truncated_document_raises():
+    data = json.dumps({'participants' : [{'id' : 1}, {'id' : 2}]}).encode('utf-8')
+    with pytest.raises(Exception, match='Truncated JSON document'):
+        list(iter_json_array([data[:-8]], 'participants'))
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    from datetime import datetime, timedelta, timezone
+    from email.utils import format_datetime
+
+    assert parse_retry_after('30') == 30.0
+    assert parse_retry_after(None) == 1.0
+    assert parse_retry_after('soon', default=5.0) == 5.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(in_a_minute) <= 60
@@ -0,0 +1,58 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from WakoopaTransform import extract_profile_url, transform, transform_devices, row_hash
+from bench_extract_url import extract_url
+from synthetic import make_panel
+
+
+def login(url):
+    return {'id' : 'configurator_login_url', 'contents' : url}
+
+
+def test_extract_profile_url_matches_the_row_wise_apply():
+    links = [
+        {'configuration_parameters' : [{'id' : 'other', 'contents' : 'x'}, login('a')]},
+        {'configuration_parameters' : [login('b'), login('second')]},
+        {'configuration_parameters' : []},
+        {'configuration_parameters' : [{'id' : 'other', 'contents' : 'x'}]},
+        {'self' : '/api/v1/participants/5'},
+        None,
+    ]
+    df = pd.DataFrame({'links' : links}, index=[10, 11, 12, 13, 14, 15])
+    result = extract_profile_url(df['links'])
+    assert result.tolist() == ['a', 'b', None, None, None, None]
+    assert result.tolist() == df.apply(extract_url, axis=1).tolist()
+    assert list(result.index) == [10, 11, 12, 13, 14, 15]
+
+
+def test_extract_profile_url_matches_the_row_wise_apply_on_a_panel():
+    df = pd.DataFrame(make_panel(1000, devices=0))
+    expected = df.apply(extract_url, axis=1)
+    assert extract_profile_url(df['links']).fillna('').equals(expected.fillna(''))
+
+
+def test_extract_profile_url_without_any_parameters():
+    links = pd.Series([None, {'self' : '/api/v1/participants/1'}])
+    assert extract_profile_url(links).tolist() == [None, None]
+
+
+def test_row_hash_follows_the_devices_of_a_participant():
+    participants = [{'id' : i, 'tags' : ['a'], 'time_zone' : 'Singapore', 'created_at' : '2023-01-01T00:00:00Z', 'profile_url' : f'url{i}',
+                     'devices' : [{'id' : 10 * i + d, 'platform' : 'android', 'created_at' : '2023-01-01T00:00:00Z'} for d in range(2)]}
+                    for i in range(3)]
+
+    def hashes(participants):
+        return row_hash(transform(participants), transform_devices(participants))
+
+    before = hashes(participants)
+    participants[0]['devices'].reverse()
+    participants[1]['devices'][0]['platform'] = 'ios'
+    participants[2]['devices'].pop()
+    after = hashes(participants)
+    # order does not matter, a changed or removed device does
+    assert before[0] == after[0]
+    assert before[1] != after[1]
+    assert before[2] != after[2]
+    assert (row_hash(transform(participants)) != after).all()